@@ -1,5 +1,5 @@
+import array
 import dataclasses
-import math
 import os
 import sys
 
@@ -64,35 +64,193 @@ def parse_input(filepath):
         return claw_machines
 
 
+# Translation table that blanks out everything but digits and minus signs.
+NUMBER_BYTES = bytes(
+    b if b in b'0123456789-' else ord(' ') for b in range(256)
+)
+
+
+def iter_claw_machines(filepath, block_size=1 << 16):
+    """Yield (ax, ay, bx, by, px, py) tuples while reading the file in
+    blocks, so memory stays flat no matter how many machines there are.
+    """
+    values = []
+    tail = b''
+    with open(filepath, 'rb') as infile:
+        while 1:
+            block = infile.read(block_size)
+            if not block:
+                break
+            block = (tail + block).translate(NUMBER_BYTES)
+            # The last number may continue into the next block.
+            cut = block.rfind(b' ') + 1
+            tail = block[cut:]
+            values.extend(map(int, block[:cut].split()))
+            n = len(values) - len(values) % 6
+            for i in range(0, n, 6):
+                yield tuple(values[i:i+6])
+            del values[:n]
+    values.extend(map(int, tail.split()))
+    for i in range(0, len(values) - 5, 6):
+        yield tuple(values[i:i+6])
+
+
+def parse_arrays(filepath, block_size=1 << 16):
+    """Parse the file into six parallel arrays suitable for min_costs."""
+    columns = tuple(array.array('q') for _ in range(6))
+    for machine in iter_claw_machines(filepath, block_size):
+        for column, value in zip(columns, machine):
+            column.append(value)
+    return columns
+
+
+def test_iter_claw_machines():
+    claw_machines = parse_input(os.path.join('data', 'test13a.txt'))
+    expected = [
+        (m.button_a.x, m.button_a.y, m.button_b.x, m.button_b.y,
+         m.prize_location.x, m.prize_location.y)
+        for m in claw_machines
+    ]
+    # Superscript digits in Latin-1 must not be kept as digits.
+    assert bytes(range(256)).translate(NUMBER_BYTES).split() == [b'-', b'0123456789']
+    # Tiny blocks force numbers to be split across reads.
+    for block_size in (1, 7, 1 << 16):
+        assert list(iter_claw_machines(os.path.join('data', 'test13a.txt'), block_size)) == expected
+
+
+def extended_gcd(a, b):
+    """Return (g, x, y) such that a*x + b*y = g = gcd(a, b)."""
+    x0, y0, x1, y1 = 1, 0, 0, 1
+    while b:
+        q, r = divmod(a, b)
+        a, b = b, r
+        x0, x1 = x1, x0 - q * x1
+        y0, y1 = y1, y0 - q * y1
+    if a < 0:
+        return -a, -x0, -y0
+    return a, x0, y0
+
+
+def min_cost_on_line(u, w, t, a_cost=3, b_cost=1):
+    """Minimum cost non-negative solution to u*a + w*b = t.
+
+    Used when the buttons are collinear and the 2x2 system collapses
+    to a single equation.  Solutions lie on the line
+    a = a0 + k*s, b = b0 - k*r and the cost is linear in k, so the
+    optimum sits at one end of the feasible range of k.
+    """
+    if u == 0 and w == 0:
+        return (0, 0) if t == 0 else None
+    if u == 0:
+        b, rem = divmod(t, w)
+        return (0, b) if rem == 0 and b >= 0 else None
+    if w == 0:
+        a, rem = divmod(t, u)
+        return (a, 0) if rem == 0 and a >= 0 else None
+
+    g, x, y = extended_gcd(u, w)
+    m, rem = divmod(t, g)
+    if rem:
+        return None
+    a0, b0 = x * m, y * m
+    s, r = w // g, u // g
+
+    # Feasible range for k from a >= 0 and b >= 0; None is unbounded.
+    lo, hi = None, None
+    def tighten_lo(k):
+        return k if lo is None else max(lo, k)
+    def tighten_hi(k):
+        return k if hi is None else min(hi, k)
+    if s > 0:
+        lo = tighten_lo(-(a0 // s))
+    else:
+        hi = tighten_hi((-a0) // s)
+    if r > 0:
+        hi = tighten_hi(b0 // r)
+    else:
+        lo = tighten_lo(-((-b0) // r))
+    if lo is not None and hi is not None and lo > hi:
+        return None
+
+    slope = a_cost * s - b_cost * r
+    if slope > 0:
+        k = lo if lo is not None else hi
+    elif slope < 0:
+        k = hi if hi is not None else lo
+    else:
+        k = lo if lo is not None else hi
+    return a0 + k * s, b0 - k * r
+
+
+def solve_exact(ax, ay, bx, by, px, py, a_cost=3, b_cost=1):
+    """Return (a_pushes, b_pushes) for the cheapest way to reach the
+    prize, or None.  Uses Cramer's rule with integer arithmetic only.
+    """
+    det = ax * by - ay * bx
+    if det:
+        a_pushes, a_rem = divmod(px * by - py * bx, det)
+        b_pushes, b_rem = divmod(ax * py - ay * px, det)
+        if a_rem or b_rem or a_pushes < 0 or b_pushes < 0:
+            return None
+        return a_pushes, b_pushes
+
+    # Collinear buttons: solve along whichever axis is non-trivial and
+    # check the result against the other axis.
+    if ax or bx:
+        soln = min_cost_on_line(ax, bx, px, a_cost, b_cost)
+    else:
+        soln = min_cost_on_line(ay, by, py, a_cost, b_cost)
+    if soln is None:
+        return None
+    a_pushes, b_pushes = soln
+    if a_pushes * ax + b_pushes * bx != px or a_pushes * ay + b_pushes * by != py:
+        return None
+    return a_pushes, b_pushes
+
+
 def min_cost(claw_machine, a_cost=3, b_cost=1):
-    ax, ay = claw_machine.button_a.x, claw_machine.button_a.y
-    bx, by = claw_machine.button_b.x, claw_machine.button_b.y
-    px, py = claw_machine.prize_location.x, claw_machine.prize_location.y
+    soln = solve_exact(
+        claw_machine.button_a.x, claw_machine.button_a.y,
+        claw_machine.button_b.x, claw_machine.button_b.y,
+        claw_machine.prize_location.x, claw_machine.prize_location.y,
+        a_cost, b_cost
+    )
+    if soln is None:
+        return None
+    a_pushes, b_pushes = soln
+    return (a_cost * a_pushes) + (b_cost * b_pushes)
+
 
-    # ax(x) + bx(x) = px
-    # ay(y) + by(y) = py
+def min_costs(axs, ays, bxs, bys, pxs, pys, a_cost=3, b_cost=1):
+    """Batch version of min_cost over parallel sequences of coefficients.
 
-    # Eliminate a pushes
-    l = math.lcm(ax, ay)
-    bx_ = bx * (l // ax)
-    by_ = by * (l // ay)
-    px_ = px * (l // ax)
-    py_ = py * (l // ay)
+    Returns an array of costs with -1 for machines that cannot be won.
+    """
+    costs = array.array('q', bytes(8 * len(axs)))
+    for i, (ax, ay, bx, by, px, py) in enumerate(zip(axs, ays, bxs, bys, pxs, pys)):
+        pushes = solve_exact(ax, ay, bx, by, px, py, a_cost, b_cost)
+        if pushes is None:
+            costs[i] = -1
+        else:
+            costs[i] = (a_cost * pushes[0]) + (b_cost * pushes[1])
+    return costs
 
-    # Solve for b pushes
-    b0 = bx_ - by_
-    p0 = px_ - py_
-    b_pushes = p0 / b0
 
-    # Solve for a pushes
-    # ax = tx - bx
-    a_pushes = (px - (b_pushes * bx)) / ax
+def test_solve_exact():
+    assert solve_exact(94, 34, 22, 67, 8400, 5400) == (80, 40)
+    assert solve_exact(26, 66, 67, 21, 12748, 12176) is None
+    # Collinear buttons: B is cheaper per unit of distance.
+    assert solve_exact(2, 2, 1, 1, 10, 10) == (0, 10)
+    # Collinear buttons: A is cheaper per unit of distance.
+    assert solve_exact(4, 4, 1, 1, 10, 10, a_cost=1, b_cost=1) == (2, 2)
+    assert solve_exact(3, 3, 6, 6, 10, 10) is None
+    assert solve_exact(2, 2, 1, 1, 10, 11) is None
+    assert solve_exact(0, 0, 0, 0, 0, 0) == (0, 0)
 
-    # Only return integer solutions
-    a_pushes, b_pushes = int(a_pushes), int(b_pushes)
-    if (a_pushes * ax) + (b_pushes * bx) == px and (a_pushes * ay) + (b_pushes * by) == py:
-        return (a_cost * a_pushes) + (b_cost * b_pushes)
-    return None
+
+def test_min_costs():
+    costs = min_costs(*parse_arrays(os.path.join('data', 'test13a.txt')))
+    assert list(costs) == [280, -1, 200, -1]
 
 
 def solve1(claw_machines, a_cost=3, b_cost=1):
@@ -123,6 +281,20 @@ def solve2(claw_machines, a_cost=3, b_cost=1, delta=10000000000000):
     return soln
 
 
+def solve_stream(filepath, a_cost=3, b_cost=1, delta=0):
+    """Parse and solve one machine at a time straight from the file."""
+    soln = 0
+    for ax, ay, bx, by, px, py in iter_claw_machines(filepath):
+        pushes = solve_exact(ax, ay, bx, by, px + delta, py + delta, a_cost, b_cost)
+        if pushes is not None:
+            soln += (a_cost * pushes[0]) + (b_cost * pushes[1])
+    return soln
+
+
+def test_solve_stream():
+    assert solve_stream(os.path.join('data', 'test13a.txt')) == 480
+
+
 def main():
     "Main program"
     claw_machines = parse_input(os.path.join('data', 'input13.txt'))
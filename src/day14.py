@@ -1,7 +1,9 @@
+import array
 import collections
 import dataclasses
 import math
 import os
+import random
 import sys
 
 import pyperclip
@@ -55,31 +57,8 @@ def parse_input(filepath):
     return robots
 
 
-def get_quadrant(robot, grid_limits: Vector) -> int:
-    y_mid = grid_limits.y // 2
-    x_mid = grid_limits.x // 2
-    quadrant = ''
-    if robot.position.y == y_mid:
-        return 'None'
-    elif robot.position.y > y_mid:
-        quadrant += 'T'
-    else:
-        quadrant += 'B'
-    if robot.position.x == x_mid:
-        return 'None'
-    elif robot.position.x > x_mid:
-        quadrant += 'R'
-    else:
-        quadrant += 'L'
-    return quadrant
-
-
 def solve1(robots, grid_limits: Vector) -> int:
-    robots0 = [robot.move(grid_limits, 100) for robot in robots]
-    quadrants = collections.defaultdict(int)
-    for robot in robots0:
-        quadrants[get_quadrant(robot, grid_limits)] += 1
-    return math.prod(x for q, x in quadrants.items() if q != 'None')
+    return math.prod(Swarm(robots, grid_limits).quadrant_counts(100))
 
 
 def test_solve1():
@@ -87,6 +66,61 @@ def test_solve1():
     assert solve1(robots, Vector(11, 7)) == 12
 
 
+class Swarm:
+    """All robots stored as flat integer arrays.
+
+    The position of every robot at any tick is computed directly as
+    (p + v*t) mod L, so no intermediate states are ever built.
+    """
+
+    def __init__(self, robots, grid_limits: Vector):
+        self.width = grid_limits.x
+        self.height = grid_limits.y
+        self.px = array.array('q', (r.position.x for r in robots))
+        self.py = array.array('q', (r.position.y for r in robots))
+        self.vx = array.array('q', (r.velocity.x % self.width for r in robots))
+        self.vy = array.array('q', (r.velocity.y % self.height for r in robots))
+        # Each axis maps to a bin offset: 0 or 1 (x) and 0 or 2 (y) for
+        # the two halves, and 4 or 8 for the middle line, so any robot
+        # on a middle line lands in a bin >= 4 and is ignored.
+        x_mid, y_mid = self.width // 2, self.height // 2
+        self.x_bins = [0] * x_mid + [4] + [1] * (self.width - x_mid - 1)
+        self.y_bins = [0] * y_mid + [8] + [2] * (self.height - y_mid - 1)
+
+    def __len__(self):
+        return len(self.px)
+
+    def xs_at(self, tick):
+        w = self.width
+        return array.array('q', [(p + v * tick) % w for p, v in zip(self.px, self.vx)])
+
+    def ys_at(self, tick):
+        h = self.height
+        return array.array('q', [(p + v * tick) % h for p, v in zip(self.py, self.vy)])
+
+    def positions_at(self, tick):
+        return self.xs_at(tick), self.ys_at(tick)
+
+    def quadrant_counts(self, tick):
+        """Return the robot counts of the four quadrants at the given tick."""
+        x_bins, y_bins = self.x_bins, self.y_bins
+        counts = [0] * 13
+        for x, y in zip(self.xs_at(tick), self.ys_at(tick)):
+            counts[x_bins[x] + y_bins[y]] += 1
+        return counts[:4]
+
+
+def test_swarm():
+    robots = parse_input(os.path.join('data', 'test14a.txt'))
+    grid_limits = Vector(11, 7)
+    swarm = Swarm(robots, grid_limits)
+    for tick in (0, 1, 5, 100):
+        xs, ys = swarm.positions_at(tick)
+        expected = [robot.move(grid_limits, tick).position for robot in robots]
+        assert [Vector(x, y) for x, y in zip(xs, ys)] == expected
+    assert math.prod(swarm.quadrant_counts(100)) == 12
+
+
 def print_grid(robots, grid_limits):
     grid = [[' ' for _ in range(grid_limits.x)] for _ in range(grid_limits.y)]
     for robot in robots:
@@ -94,23 +128,71 @@ def print_grid(robots, grid_limits):
     print('\n'.join(''.join(row) for row in grid))
 
 
-def solve2(robots, grid_limits: Vector):
-    # All robots move through a cycle of length 10403
-    # There are 500 robots
-    # Most(?) of the robots are involved in the christmas tree
-    most = len(robots) // 2
-    soln = 10404
-    for tick in range(10403):
-        quadrants = collections.defaultdict(int)
-        for robot in robots:
-            quadrants[get_quadrant(robot, grid_limits)] += 1
-        if any(x > most for q, x in quadrants.items() if q != 'None'):
-            # print('*'*140)
-            # print(tick)
-            # print('*'*140)
-            # print_grid(robots, grid_limits)
-            return tick
-        robots = [r.move(grid_limits,1) for r in robots]
+def variance_score(values, limit):
+    n = len(values)
+    mean = sum(values) / n
+    return sum((v - mean) ** 2 for v in values) / n
+
+
+def entropy_score(values, limit):
+    n = len(values)
+    counts = collections.Counter(values)
+    return -sum((c / n) * math.log(c / n) for c in counts.values())
+
+
+def skew_score(values, limit):
+    # Negated so that, like the other scores, lower means more clustered.
+    mid = limit // 2
+    lower = sum(1 for v in values if v < mid)
+    upper = sum(1 for v in values if v > mid)
+    return -max(lower, upper)
+
+
+def chinese_remainder(r1, m1, r2, m2):
+    """Return the t in [0, m1*m2) with t = r1 (mod m1) and t = r2 (mod m2)."""
+    if math.gcd(m1, m2) != 1:
+        raise ValueError(f'Moduli {m1} and {m2} are not coprime')
+    return (r1 + m1 * ((r2 - r1) * pow(m1, -1, m2))) % (m1 * m2)
+
+
+def test_chinese_remainder():
+    for t in (0, 1, 100, 7892, 10402):
+        assert chinese_remainder(t % 101, 101, t % 103, 103) == t
+
+
+def find_cluster_tick(swarm, score=variance_score):
+    """Find the tick at which the robots are most clustered.
+
+    x coordinates repeat with period width and y coordinates with
+    period height, so each axis is searched independently for its most
+    clustered tick and the two are combined with the CRT.
+    """
+    tx = min(range(swarm.width), key=lambda t: score(swarm.xs_at(t), swarm.width))
+    ty = min(range(swarm.height), key=lambda t: score(swarm.ys_at(t), swarm.height))
+    return chinese_remainder(tx, swarm.width, ty, swarm.height)
+
+
+def test_find_cluster_tick():
+    # Plant a cluster at a known tick and scatter the remaining robots.
+    rng = random.Random(14)
+    grid_limits = Vector(31, 37)
+    target = 777
+    robots = []
+    for i in range(200):
+        v = Vector(rng.randrange(1, 31), rng.randrange(1, 37))
+        if i < 150:
+            at_target = Vector(10 + rng.randrange(5), 20 + rng.randrange(5))
+            p = (at_target + v * -target) % grid_limits
+        else:
+            p = Vector(rng.randrange(31), rng.randrange(37))
+        robots.append(Robot(p, v))
+    swarm = Swarm(robots, grid_limits)
+    for score in (variance_score, entropy_score, skew_score):
+        assert find_cluster_tick(swarm, score) == target
+
+
+def solve2(robots, grid_limits: Vector, score=variance_score):
+    return find_cluster_tick(Swarm(robots, grid_limits), score)
 
 
 def main():
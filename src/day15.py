@@ -1,3 +1,6 @@
+import array
+import dataclasses
+import itertools
 import os
 import sys
 
@@ -21,25 +24,19 @@ class Box1:
         self.row = r
         self.column = c
 
-    def can_move(self, direction, items):
-        r0, c0 = self.row + direction.row, self.column + direction.column
-        result = True
-        for item in items:
-            if item.collides(r0, c0):
-                result = result and item.can_move(direction, items)
-        return result
-
-    def move(self, direction, items):
-        r0, c0 = self.row + direction.row, self.column + direction.column
-        for item in items:
-            if item.collides(r0, c0):
-                item.move(direction, items)
-        assert not any(item.collides(r0, c0) for item in items)
-        self.row = r0
-        self.column = c0
-
-    def collides(self, r, c):
-        return r == self.row and c == self.column
+    def cells(self):
+        yield self.row, self.column
+
+    def cells_ahead(self, direction):
+        return ((self.row + direction.row, self.column + direction.column),)
+
+    def shift(self, direction, steps=1):
+        self.row += direction.row * steps
+        self.column += direction.column * steps
+
+    def place(self, r, c):
+        self.row = r
+        self.column = c
 
     def __repr__(self):
         return f'Box1({self.row}, {self.column})'
@@ -51,75 +48,30 @@ class Box2:
         self.column1 = c
         self.column2 = c + 1
 
-    def can_move(self, direction, items):
-        # print(f'Box2 can_move({self}, {direction}, ...)')
-        if direction == Direction(r=0, c=1):
-            # Right
-            r0, c0 = self.row + direction.row, self.column2 + direction.column
-            result = True
-            for item in items:
-                if item.collides(r0, c0):
-                    result = result and item.can_move(direction, items)
-            return result
-        elif direction == Direction(r=0, c=-1):
-            # Left
-            r0, c0 = self.row + direction.row, self.column1 + direction.column
-            result = True
-            for item in items:
-                if item.collides(r0, c0):
-                    result = result and item.can_move(direction, items)
-            return result
-        elif direction == Direction(r=1, c=0):
-            r0, c0, c1 = self.row + direction.row, self.column1 + direction.column, self.column2 + direction.column
-            result = True
-            for item in items:
-                if item.collides(r0, c0) or item.collides(r0, c1):
-                    result = result and item.can_move(direction, items)
-            return result
-        elif direction == Direction(r=-1, c=0):
-            r0, c0, c1 = self.row + direction.row, self.column1 + direction.column, self.column2 + direction.column
-            result = True
-            for item in items:
-                if item.collides(r0, c0) or item.collides(r0, c1):
-                    result = result and item.can_move(direction, items)
-            return result
-
-    def move(self, direction, items):
+    def cells(self):
+        yield self.row, self.column1
+        yield self.row, self.column2
+
+    def cells_ahead(self, direction):
         if direction == Direction(r=0, c=1):
             # Right
-            r0, c0 = self.row + direction.row, self.column2 + direction.column
-            for item in items:
-                if item.collides(r0, c0):
-                    item.move(direction, items)
-            assert not any(item.collides(r0, c0) for item in items)
-            self.column1 += 1
-            self.column2 += 1
+            return ((self.row, self.column2 + 1),)
         elif direction == Direction(r=0, c=-1):
             # Left
-            r0, c0 = self.row + direction.row, self.column1 + direction.column
-            for item in items:
-                if item.collides(r0, c0):
-                    item.move(direction, items)
-            assert not any(item.collides(r0, c0) for item in items)
-            self.column1 -= 1
-            self.column2 -= 1
-        elif direction == Direction(r=1, c=0):
-            r0, c0, c1 = self.row + direction.row, self.column1 + direction.column, self.column2 + direction.column
-            for item in items:
-                if item.collides(r0, c0) or item.collides(r0, c1):
-                    item.move(direction, items)
-            assert not any(item.collides(r0, c0) or item.collides(r0, c1) for item in items)
-            self.row += 1
-        elif direction == Direction(r=-1, c=0):
-            r0, c0, c1 = self.row + direction.row, self.column1 + direction.column, self.column2 + direction.column
-            for item in items:
-                if item.collides(r0, c0) or item.collides(r0, c1):
-                    item.move(direction, items)
-            assert not any(item.collides(r0, c0) or item.collides(r0, c1) for item in items)
-            self.row -= 1
-
-    def collides(self, r, c):
-        return r == self.row and c in [self.column1, self.column2]
+            return ((self.row, self.column1 - 1),)
+        else:
+            r0 = self.row + direction.row
+            return ((r0, self.column1), (r0, self.column2))
+
+    def shift(self, direction, steps=1):
+        self.row += direction.row * steps
+        self.column1 += direction.column * steps
+        self.column2 += direction.column * steps
+
+    def place(self, r, c):
+        self.row = r
+        self.column1 = c
+        self.column2 = c + 1
 
     def __repr__(self):
         return f'Box2({self.row}, [{self.column1}, {self.column2}])'
@@ -130,14 +82,8 @@ class Wall:
         self.row = r
         self.column = c
 
-    def can_move(self, direction, items):
-        return False
-
-    def move(self, direction, items):
-        raise ValueError(f'Cannot move a wall {self}')
-
-    def collides(self, r, c):
-        return r == self.row and c == self.column
+    def cells(self):
+        yield self.row, self.column
 
     def __repr__(self):
         return f'Wall({self.row}, {self.column})'
@@ -148,30 +94,187 @@ class Robot:
         self.row = r
         self.column = c
 
-    def can_move(self, direction, items):
-        r0, c0 = self.row + direction.row, self.column + direction.column
-        result = True
-        for item in items:
-            if item.collides(r0, c0):
-                result = result and item.can_move(direction, items)
-        return result
-
-    def move(self, direction, items):
-        r0, c0 = self.row + direction.row, self.column + direction.column
-        for item in items:
-            if item.collides(r0, c0):
-                item.move(direction, items)
-        assert not any(item.collides(r0, c0) for item in items)
-        self.row = r0
-        self.column = c0
-
-    def collides(self, r, c):
-        return r == self.row and c == self.column
-
     def __repr__(self):
         return f'Robot({self.row}, {self.column})'
 
 
+@dataclasses.dataclass(frozen=True)
+class Snapshot:
+    robot_row: int
+    robot_column: int
+    rows: array.array
+    columns: array.array
+
+
+class Warehouse:
+    """Walls and boxes indexed by an occupancy grid of item ids.
+
+    Every move updates the grid in place, so finding what is in a cell
+    is a single lookup instead of a scan over all items.
+    """
+
+    EMPTY = -1
+
+    def __init__(self, grid):
+        self.N, self.M = len(grid), len(grid[0])
+        self.occupancy = [[Warehouse.EMPTY] * self.M for _ in range(self.N)]
+        self.items = []
+        self.robot = None
+        for r, row in enumerate(grid):
+            for c, val in enumerate(row):
+                if val == '@':
+                    self.robot = Robot(r, c)
+                elif val == '#':
+                    self.add(Wall(r, c))
+                elif val == 'O':
+                    self.add(Box1(r, c))
+                elif val == '[':
+                    self.add(Box2(r, c))
+        # Walls never move, so only boxes are saved in snapshots.
+        self.boxes = [item for item in self.items if not isinstance(item, Wall)]
+
+    def add(self, item):
+        item.item_id = len(self.items)
+        self.items.append(item)
+        self.drop(item)
+
+    def lift(self, item):
+        for r, c in item.cells():
+            self.occupancy[r][c] = Warehouse.EMPTY
+
+    def drop(self, item):
+        for r, c in item.cells():
+            assert self.occupancy[r][c] == Warehouse.EMPTY
+            self.occupancy[r][c] = item.item_id
+
+    def at(self, r, c):
+        item_id = self.occupancy[r][c]
+        if item_id == Warehouse.EMPTY:
+            return None
+        return self.items[item_id]
+
+    def plan_push(self, direction):
+        """Return the boxes the robot would push, nearest row first, or
+        None if the push is blocked by a wall.
+
+        Boxes are collected one frontier at a time, so a box reached
+        through two different parents is only visited once.
+        """
+        robot = self.robot
+        frontier = [(robot.row + direction.row, robot.column + direction.column)]
+        seen = set()
+        boxes = []
+        while frontier:
+            next_frontier = []
+            for r, c in frontier:
+                item = self.at(r, c)
+                if item is None or item.item_id in seen:
+                    continue
+                if isinstance(item, Wall):
+                    return None
+                seen.add(item.item_id)
+                boxes.append(item)
+                next_frontier.extend(item.cells_ahead(direction))
+            frontier = next_frontier
+        return boxes
+
+    def push(self, direction):
+        """Move the robot one step, pushing boxes, if it can.  Returns
+        whether the robot moved.
+        """
+        boxes = self.plan_push(direction)
+        if boxes is None:
+            return False
+        # Farthest boxes first so each one moves into an empty cell.
+        for box in reversed(boxes):
+            self.lift(box)
+            box.shift(direction)
+            self.drop(box)
+        self.robot.row += direction.row
+        self.robot.column += direction.column
+        return True
+
+    def push_run(self, direction, count):
+        """Apply the same instruction count times.  Returns the number
+        of steps the robot actually moved.
+
+        When everything ahead of the robot lies on one line, the robot
+        and its train of boxes are moved to their final places in one go.
+        Wide boxes pushed vertically can fan out, so those runs fall back
+        to single pushes, stopping at the first blocked one.
+        """
+        robot = self.robot
+        r, c = robot.row, robot.column
+        empties = 0
+        distance = 0
+        # (box, distance of its nearest cell, box cells passed before it)
+        train = []
+        box_cells = 0
+        while empties < count:
+            r += direction.row
+            c += direction.column
+            distance += 1
+            item = self.at(r, c)
+            if item is None:
+                empties += 1
+            elif isinstance(item, Wall):
+                break
+            elif direction.row and isinstance(item, Box2):
+                return self.push_steps(direction, count)
+            else:
+                if not train or train[-1][0] is not item:
+                    train.append((item, distance, box_cells))
+                box_cells += 1
+
+        steps = empties
+        if steps == 0:
+            return 0
+        for box, _, _ in train:
+            self.lift(box)
+        # The train is packed up against the robot's final position.
+        for box, distance, cells_before in train:
+            box.shift(direction, steps + 1 + cells_before - distance)
+        for box, _, _ in train:
+            self.drop(box)
+        robot.row += direction.row * steps
+        robot.column += direction.column * steps
+        return steps
+
+    def push_steps(self, direction, count):
+        steps = 0
+        while steps < count and self.push(direction):
+            steps += 1
+        return steps
+
+    def snapshot(self):
+        # Each box is saved by its first (for Box2, leftmost) cell.
+        corners = [next(box.cells()) for box in self.boxes]
+        return Snapshot(
+            self.robot.row, self.robot.column,
+            array.array('i', (r for r, _ in corners)),
+            array.array('i', (c for _, c in corners))
+        )
+
+    def restore(self, snapshot):
+        for box in self.boxes:
+            self.lift(box)
+        for box, r, c in zip(self.boxes, snapshot.rows, snapshot.columns):
+            box.place(r, c)
+        for box in self.boxes:
+            self.drop(box)
+        self.robot.row = snapshot.robot_row
+        self.robot.column = snapshot.robot_column
+
+    def gps(self):
+        soln = 0
+        for item in self.items:
+            if isinstance(item, Box1):
+                soln += (100 * item.row) + item.column
+            if isinstance(item, Box2):
+                soln += (100 * item.row) + item.column1
+        return soln
+
+
 def parse_input(filepath):
     with open(filepath, 'r') as infile:
         lines = [line.strip() for line in infile]
@@ -203,53 +306,69 @@ def make_grid(items, robot, N, M):
     return '\n'.join(''.join(row) for row in grid0)
 
 
-def solve1(grid, instructions):
-    N, M = len(grid), len(grid[0])
-    # Find items
-    robot = None
-    items = []
-    for r, row in enumerate(grid):
-        for c, val in enumerate(row):
-            if val == '@':
-                robot = Robot(r, c)
-            elif val == '#':
-                items.append(Wall(r, c))
-            elif val == 'O':
-                items.append(Box1(r, c))
-            elif val == '[':
-                items.append(Box2(r, c))
-
+class Simulation:
+    """Replays instructions with a snapshot every interval instructions,
+    so any point in the run can be reached by restoring the nearest
+    earlier snapshot and replaying only what comes after it.
+    """
+
+    def __init__(self, grid, instructions, interval=1000):
+        self.warehouse = Warehouse(grid)
+        self.instructions = instructions
+        self.interval = interval
+        self.snapshots = [self.warehouse.snapshot()]
+        self.index = 0
+
+    def seek(self, index):
+        """Return the warehouse as it is after the first index instructions."""
+        if not 0 <= index <= len(self.instructions):
+            raise IndexError(f'Instruction index {index} out of range')
+        checkpoint = min(index // self.interval, len(self.snapshots) - 1)
+        if not checkpoint * self.interval <= self.index <= index:
+            self.warehouse.restore(self.snapshots[checkpoint])
+            self.index = checkpoint * self.interval
+        while self.index < index:
+            self.warehouse.push(DIRECTIONS[self.instructions[self.index]])
+            self.index += 1
+            if self.index % self.interval == 0 and self.index // self.interval == len(self.snapshots):
+                self.snapshots.append(self.warehouse.snapshot())
+        return self.warehouse
+
+
+DIRECTIONS = {
+    '>': Direction(0, 1),
+    '<': Direction(0, -1),
+    '^': Direction(-1, 0),
+    'v': Direction(1, 0)
+}
+
+
+def solve1(grid, instructions, batch_runs=True):
+    warehouse = Warehouse(grid)
+    robot = warehouse.robot
     assert robot
-    assert items
-    directions = {
-        '>': Direction(0, 1),
-        '<': Direction(0, -1),
-        '^': Direction(-1, 0),
-        'v': Direction(1, 0)
-    }
-
-    # print(make_grid(items, robot, N, M))
+    assert warehouse.items
+
+    if batch_runs:
+        for instruction, run in itertools.groupby(instructions):
+            warehouse.push_run(DIRECTIONS[instruction], sum(1 for _ in run))
+        return warehouse.gps()
+
+    # print(make_grid(warehouse.items, robot, warehouse.N, warehouse.M))
     for i, instruction in enumerate(instructions):
         # print(i, instruction, robot)
-        direction = directions[instruction]
-        if robot.can_move(direction, items):
-            robot.move(direction, items)
-        # print(make_grid(items, robot, N, M))
+        warehouse.push(DIRECTIONS[instruction])
+        # print(make_grid(warehouse.items, robot, warehouse.N, warehouse.M))
 
-    soln = 0
-    for item in items:
-        if isinstance(item, Box1):
-            soln += (100 * item.row) + item.column
-        if isinstance(item, Box2):
-            soln += (100 * item.row) + item.column1
-    return soln
+    return warehouse.gps()
 
 
 def test_solve1():
-    grid, instructions = parse_input(os.path.join('data', 'test15a.txt'))
-    assert solve1(grid, instructions) == 2028
-    grid, instructions = parse_input(os.path.join('data', 'test15b.txt'))
-    assert solve1(grid, instructions) == 10092
+    for batch_runs in (True, False):
+        grid, instructions = parse_input(os.path.join('data', 'test15a.txt'))
+        assert solve1(grid, instructions, batch_runs) == 2028
+        grid, instructions = parse_input(os.path.join('data', 'test15b.txt'))
+        assert solve1(grid, instructions, batch_runs) == 10092
 
 
 def double_grid(grid):
@@ -275,14 +394,51 @@ def double_grid(grid):
     return tuple(grid0)
 
 
-def solve2(grid, instructions):
+def solve2(grid, instructions, batch_runs=True):
     grid0 = double_grid(grid)
-    return solve1(grid0, instructions)
+    return solve1(grid0, instructions, batch_runs)
 
 
 def test_solve2():
     grid, instructions = parse_input(os.path.join('data', 'test15b.txt'))
-    assert solve2(grid, instructions) == 9021
+    for batch_runs in (True, False):
+        assert solve2(grid, instructions, batch_runs) == 9021
+
+
+def test_plan_push():
+    grid = (
+        tuple('##########'),
+        tuple('#........#'),
+        tuple('#..[][]..#'),
+        tuple('#...[]...#'),
+        tuple('#...@....#'),
+        tuple('##########'),
+    )
+    warehouse = Warehouse(grid)
+    up = DIRECTIONS['^']
+    # The top-left and top-right boxes are both reached from below.
+    assert len(warehouse.plan_push(up)) == 3
+    assert warehouse.push(up)
+    assert warehouse.plan_push(up) is None
+    assert not warehouse.push(up)
+    assert make_grid(warehouse.items, warehouse.robot, warehouse.N, warehouse.M) == '\n'.join((
+        '##########',
+        '#..[][]..#',
+        '#...[]...#',
+        '#...@....#',
+        '#........#',
+        '##########',
+    ))
+
+
+def test_simulation():
+    grid, instructions = parse_input(os.path.join('data', 'test15b.txt'))
+    for grid0 in (grid, double_grid(grid)):
+        simulation = Simulation(grid0, instructions, interval=64)
+        for index in (600, 5, 699, 64, 700, 0, 128, 450):
+            expected = solve1(grid0, instructions[:index])
+            assert simulation.seek(index).gps() == expected
+        assert simulation.seek(len(instructions)).gps() == solve1(grid0, instructions)
 
 
 def main():
@@ -1,7 +1,6 @@
-import collections
+import array
 import dataclasses
 import heapq
-import math
 import os
 import sys
 
@@ -13,20 +12,6 @@ class Vector:
     row: int
     col: int
 
-    def opposite(self):
-        return Vector(self.row * -1, self.col * -1)
-
-    def __add__(self, other):
-        return Vector(self.row + other.row, self.col + other.col)
-
-    def __mul__(self, scalar):
-        return Vector(self.row * scalar, self.col * scalar)
-
-    def __lt__(self, other):
-        if self.row == other.row:
-            return self.col < other.col
-        return self.row < other.row
-
 
 DIRECTIONS = (
     Vector(0, 1),
@@ -42,93 +27,88 @@ def parse_input(filepath):
     return grid
 
 
-def inbounds(grid, posn):
-    return posn.row >= 0 and posn.row < len(grid) and posn.col >= 0 and posn.col < len(grid[posn.row])
-
+# Integer state encoding: state = cell * 4 + direction, where cell is
+# the flattened grid index and direction indexes DIRECTIONS.  Opposite
+# directions differ only in the low bit.
+INF = 1 << 62
 
-def grid_get(grid, posn):
-    return grid[posn.row][posn.col]
 
-
-def neighbors(grid, posn, dirn):
-    """Return tuple of neighbor posn, dirn, and cost
+def flatten_grid(grid):
+    """Return open cells as a bytearray, the row width, and the source
+    and sink cell indices.
     """
-    for offset in DIRECTIONS:
-        # Do go backwards
-        if offset == (dirn * -1):
-            continue
-        # Forward is same direction
-        if offset == dirn:
-            if grid_get(grid, posn + offset) != '#':
-                yield posn + offset, offset, 1
-        # Turns
-        if grid_get(grid, posn + offset) != '#':
-            # 1001 = 1000 (turn) + 1 (move)
-            yield posn + offset, offset, 1001
+    width = len(grid[0])
+    open_cells = bytearray(len(grid) * width)
+    source = sink = None
+    for r, row in enumerate(grid):
+        for c, val in enumerate(row):
+            cell = r * width + c
+            open_cells[cell] = val != '#'
+            if val == 'S':
+                source = cell
+            elif val == 'E':
+                sink = cell
+    assert source is not None
+    assert sink is not None
+    return open_cells, width, source, sink
 
 
-def reconstruct_path(parents, source, sink, dirn):
-    path = []
-    curr = sink
-    while curr != source:
-        path.append((curr, dirn))
-        curr, dirn = parents[(curr, dirn)]
-    return tuple(reversed(path))
+def cell_offsets(width):
+    return tuple(d.row * width + d.col for d in DIRECTIONS)
 
 
-def find_source_and_sink(grid):
-    # Find start and end
-    source = None
-    sink = None
-    for r, row in enumerate(grid):
-        for c, val in enumerate(row):
-            if grid[r][c] == 'S':
-                source = Vector(r, c)
-            if grid[r][c] == 'E':
-                sink = Vector(r, c)
-    assert source
-    assert sink
-    return source, sink
-
-
-def dijkstra(grid):
-    source, sink = find_source_and_sink(grid)
-    parents = dict()
-    distance = collections.defaultdict(lambda: math.inf)
+def state_dijkstra(open_cells, width, source_states, target_cell=None, reverse=False):
+    """Dijkstra over (cell, direction) states packed into ints.
+
+    Distances live in a flat array('q') and heap entries are plain ints
+    packing distance and state.  Returns the distance array; when
+    target_cell is given the search stops at the first state there.
+    With reverse=True every move is followed backwards, so the result
+    is the distance from each state to the source states.
+    """
+    offsets = cell_offsets(width)
+    n_states = len(open_cells) * 4
+    distance = array.array('q', [INF]) * n_states
     queue = []
-    heapq.heappush(queue, (0, source, Vector(0, 1)))
-    distance[(source, Vector(0,1))] = 0
+    for state in source_states:
+        distance[state] = 0
+        queue.append(state)
+    heapq.heapify(queue)
     while queue:
-        dist, posn, dirn = heapq.heappop(queue)
-        if posn == sink:
-            return dist, reconstruct_path(parents, source, sink, dirn)
-        if distance[(posn, dirn)] == dist:
-            for posn0, dirn0, cost in neighbors(grid, posn, dirn):
-                dist0 = dist + cost
-                if dist0 < distance[(posn0, dirn0)]:
-                    distance[(posn0, dirn0)] = dist0
-                    heapq.heappush(queue, (dist0, posn0, dirn0))
-                    parents[(posn0, dirn0)] = (posn, dirn)
-
-
-def display_path(grid, path):
-    grid0 = [list(row) for row in grid]
-    DS = {
-        Vector(0, 1): '>',
-        Vector(0, -1): '<',
-        Vector(-1, 0): '^',
-        Vector(1, 0): 'v'
-    }
-    for p, d in path:
-        if grid_get(grid, p) == '.':
-            grid0[p.row][p.col] = DS[d]
-    return '\n'.join(''.join(row) for row in grid0)
+        dist, state = divmod(heapq.heappop(queue), n_states)
+        if dist != distance[state]:
+            continue
+        cell, dirn = state >> 2, state & 3
+        if cell == target_cell:
+            break
+        for dirn0 in range(4):
+            if dirn0 == dirn ^ 1:
+                continue
+            if reverse:
+                # Arrived here facing dirn, so came from one step back.
+                cell0 = cell - offsets[dirn]
+            else:
+                cell0 = cell + offsets[dirn0]
+            if not open_cells[cell0]:
+                continue
+            # 1001 = 1000 (turn) + 1 (move)
+            dist0 = dist + (1 if dirn0 == dirn else 1001)
+            state0 = (cell0 << 2) | dirn0
+            if dist0 < distance[state0]:
+                distance[state0] = dist0
+                heapq.heappush(queue, dist0 * n_states + state0)
+    return distance
+
+
+def shortest_distance(grid):
+    open_cells, width, source, sink = flatten_grid(grid)
+    # Start facing east.
+    distance = state_dijkstra(open_cells, width, [source << 2], sink)
+    return min(distance[(sink << 2) | d] for d in range(4))
 
 
 def solve1(grid):
-    dist, path = dijkstra(grid)
-    # print(display_path(grid, path))
-    return dist
+    return shortest_distance(grid)
 
 
 def test_solve1():
@@ -138,52 +118,182 @@ def test_solve1():
     assert solve1(grid) == 11048
 
 
-def display_seats(grid, seats):
-    grid0 = [list(row) for row in grid]
-    for seat in seats:
-        grid0[seat.row][seat.col] = 'O'
-    return '\n'.join(''.join(row) for row in grid0)
+def optimal_path_cells(open_cells, width, source, sink):
+    """Return the cells on any optimal path from source (facing east) to
+    sink, found by meeting a forward distance field from the source with
+    a backward one from the sink.
+    """
+    forward = state_dijkstra(open_cells, width, [source << 2])
+    backward = state_dijkstra(
+        open_cells, width, [(sink << 2) | d for d in range(4)], reverse=True
+    )
+    best = min(forward[(sink << 2) | d] for d in range(4))
+    if best == INF:
+        return set()
+    return {
+        state >> 2
+        for state, (f, b) in enumerate(zip(forward, backward))
+        if f + b == best
+    }
 
 
-def find_good_seats(grid, max_distance):
-    # Modified Dijkstra's algorithm to find paths
-    source, sink = find_source_and_sink(grid)
-    parents = dict()
-    distance = collections.defaultdict(lambda: math.inf)
-    queue = []
-    heapq.heappush(queue, (0, source, Vector(0, 1)))
-    distance[(source, Vector(0,1))] = 0
-    while queue:
-        dist, posn, dirn = heapq.heappop(queue)
-        if dist <= max_distance:
-            if distance[(posn, dirn)] == dist:
-                for posn0, dirn0, cost in neighbors(grid, posn, dirn):
-                    dist0 = dist + cost
-                    if dist0 < distance[(posn0, dirn0)]:
-                        distance[(posn0, dirn0)] = dist0
-                        heapq.heappush(queue, (dist0, posn0, dirn0))
-                        parents[(posn0, dirn0)] = [(posn, dirn)]
-                    elif dist0 == distance[(posn0, dirn0)]:
-                        parents[(posn0, dirn0)].append((posn, dirn))
-    # BFS to reconstruct paths and find seats
-    seats = set()
-    queue = collections.deque()
-    for dirn in DIRECTIONS:
-        if (sink, dirn) in parents:
-            queue.append((sink, dirn))
-    while queue:
-        posn, dirn = queue.popleft()
-        seats.add(posn)
-        for parent in parents.get((posn, dirn), []):
-            queue.append(parent)
-    return seats
+def count_good_seats(grid, source=None, sink=None):
+    """Number of cells on an optimal path.  source and sink are (row, col)
+    pairs and default to the S and E tiles.
+    """
+    open_cells, width, source0, sink0 = flatten_grid(grid)
+    if source is not None:
+        source0 = source[0] * width + source[1]
+    if sink is not None:
+        sink0 = sink[0] * width + sink[1]
+    return len(optimal_path_cells(open_cells, width, source0, sink0))
+
+
+def test_count_good_seats():
+    grid = parse_input(os.path.join('data', 'test16a.txt'))
+    assert count_good_seats(grid) == 45
+    grid = parse_input(os.path.join('data', 'test16b.txt'))
+    assert count_good_seats(grid) == 64
+    # A straight corridor eastwards from S.
+    assert count_good_seats(grid, (15, 1), (15, 1)) == 1
+    assert count_good_seats(grid, (15, 3), (15, 15)) == 13
+
+
+class MazeGraph:
+    """The maze contracted to its junctions, built once and reused for
+    many queries.
+
+    Nodes are dead ends, junctions and any waypoints (S and E are always
+    included).  Each corridor between two nodes becomes a single edge
+    whose cost already includes the turns along it.  Queries run
+    Dijkstra over (node, direction) states, like state_dijkstra does
+    over (cell, direction) states.
+    """
+
+    def __init__(self, grid, waypoints=()):
+        open_cells, width, self.source, self.sink = flatten_grid(grid)
+        self.width = width
+        offsets = cell_offsets(width)
+        keep = {self.source, self.sink}
+        keep.update(r * width + c for r, c in waypoints)
+
+        def degree(cell):
+            return sum(open_cells[cell + offset] for offset in offsets)
+
+        self.nodes = [
+            cell for cell, is_open in enumerate(open_cells)
+            if is_open and (cell in keep or degree(cell) != 2)
+        ]
+        self.node_index = {cell: i for i, cell in enumerate(self.nodes)}
+
+        # (from node, leaving direction, to node, arriving direction,
+        # cost, cells strictly between the two nodes)
+        self.corridors = []
+        for u, node in enumerate(self.nodes):
+            for dirn_out in range(4):
+                cell = node + offsets[dirn_out]
+                if not open_cells[cell]:
+                    continue
+                dirn = dirn_out
+                cost = 1
+                cells = []
+                while cell not in self.node_index:
+                    cells.append(cell)
+                    # A corridor cell has exactly one way on.
+                    for dirn0 in range(4):
+                        if dirn0 != dirn ^ 1 and open_cells[cell + offsets[dirn0]]:
+                            break
+                    cost += 1 if dirn0 == dirn else 1001
+                    dirn = dirn0
+                    cell += offsets[dirn]
+                self.corridors.append(
+                    (u, dirn_out, self.node_index[cell], dirn, cost, tuple(cells))
+                )
+
+        self.n_states = len(self.nodes) * 4
+        self.forward_edges = [[] for _ in range(self.n_states)]
+        self.backward_edges = [[] for _ in range(self.n_states)]
+        for k, (u, dirn_out, v, dirn_in, cost, _) in enumerate(self.corridors):
+            for facing in range(4):
+                if facing == dirn_out ^ 1:
+                    continue
+                weight = cost + (0 if facing == dirn_out else 1000)
+                state, state0 = (u << 2) | facing, (v << 2) | dirn_in
+                self.forward_edges[state].append((state0, weight, k))
+                self.backward_edges[state0].append((state, weight, k))
+
+    def _node(self, cell, default):
+        if cell is None:
+            return self.node_index[default]
+        cell = cell[0] * self.width + cell[1]
+        if cell not in self.node_index:
+            raise ValueError(f'Cell {divmod(cell, self.width)} is not a node; add it as a waypoint')
+        return self.node_index[cell]
+
+    def _distances(self, edges, source_states):
+        distance = array.array('q', [INF]) * self.n_states
+        queue = []
+        for state in source_states:
+            distance[state] = 0
+            queue.append(state)
+        heapq.heapify(queue)
+        while queue:
+            dist, state = divmod(heapq.heappop(queue), self.n_states)
+            if dist != distance[state]:
+                continue
+            for state0, weight, _ in edges[state]:
+                dist0 = dist + weight
+                if dist0 < distance[state0]:
+                    distance[state0] = dist0
+                    heapq.heappush(queue, dist0 * self.n_states + state0)
+        return distance
+
+    def shortest_distance(self, source=None, sink=None):
+        """Cost from source (facing east) to sink; (row, col) pairs that
+        default to the S and E tiles.
+        """
+        u = self._node(source, self.source)
+        v = self._node(sink, self.sink)
+        distance = self._distances(self.forward_edges, [u << 2])
+        return min(distance[(v << 2) | d] for d in range(4))
+
+    def count_good_seats(self, source=None, sink=None):
+        u = self._node(source, self.source)
+        v = self._node(sink, self.sink)
+        forward = self._distances(self.forward_edges, [u << 2])
+        backward = self._distances(self.backward_edges, [(v << 2) | d for d in range(4)])
+        best = min(forward[(v << 2) | d] for d in range(4))
+        if best == INF:
+            return 0
+        seats = set()
+        for state in range(self.n_states):
+            if forward[state] + backward[state] != best:
+                continue
+            seats.add(self.nodes[state >> 2])
+            for state0, weight, k in self.forward_edges[state]:
+                if forward[state] + weight + backward[state0] == best:
+                    seats.update(self.corridors[k][5])
+        return len(seats)
+
+
+def test_maze_graph():
+    for filename in ('test16a.txt', 'test16b.txt'):
+        grid = parse_input(os.path.join('data', filename))
+        maze = MazeGraph(grid)
+        assert maze.shortest_distance() == shortest_distance(grid)
+        assert maze.count_good_seats() == count_good_seats(grid)
+        assert maze.n_states < len(grid) * len(grid[0]) * 4
+    # Arbitrary cells can be queried once they are waypoints.
+    grid = parse_input(os.path.join('data', 'test16b.txt'))
+    waypoints = ((15, 3), (15, 15), (1, 1), (7, 5))
+    maze = MazeGraph(grid, waypoints)
+    for source in waypoints:
+        for sink in waypoints:
+            assert maze.count_good_seats(source, sink) == count_good_seats(grid, source, sink)
 
 
 def solve2(grid):
-    max_distance, _ = dijkstra(grid)
-    seats = find_good_seats(grid, max_distance)
-    # print(display_seats(grid, seats))
-    return len(seats)
+    return count_good_seats(grid)
 
 
 def test_solve2():
@@ -1,7 +1,13 @@
-import collections
+import array
+import concurrent.futures
+import functools
+import itertools
 import logging
+import math
 import os
+import random
 import sys
+import time
 
 import pyperclip
 import tqdm
@@ -215,6 +221,194 @@ def test_computer():
     assert computer.registers[B] == 44354
 
 
+COMBO_SOURCE = ('0', '1', '2', '3', 'a', 'b', 'c')
+
+
+def compile_program(program, count_instructions=False):
+    """Translate program into a Python function run(a, b=0, c=0) that
+    returns the output list.
+
+    The program is split into basic blocks at jump targets and after
+    each jnz.  Each block becomes straight-line code with shifts in
+    place of division and no logging.  With count_instructions the
+    function returns (output, instructions executed) instead.
+    """
+    n = len(program)
+    leaders = {0}
+    for ip in range(0, n - 1):
+        if program[ip] == 3:
+            leaders.add(program[ip + 1])
+            leaders.add(ip + 2)
+
+    def combo(operand):
+        if operand >= 7:
+            return None
+        return COMBO_SOURCE[operand]
+
+    lines = [
+        'def run(a, b=0, c=0):',
+        '    out = []',
+        '    append = out.append',
+        '    executed = 0',
+        '    ip = 0',
+        '    while True:',
+    ]
+    keyword = 'if'
+    for leader in sorted(x for x in leaders if 0 <= x < n):
+        lines.append(f'        {keyword} ip == {leader}:')
+        keyword = 'elif'
+        ip = leader
+        size = 0
+        while True:
+            if ip + 1 >= n:
+                if count_instructions and size:
+                    lines.append(f'            executed += {size}')
+                lines.append(f'            ip = {n}')
+                break
+            opcode, operand = program[ip], program[ip + 1]
+            size += 1
+            if opcode in (0, 2, 5, 6, 7):
+                value = combo(operand)
+                if value is None:
+                    lines.append(f'            raise ValueError("Invalid combo operand: {operand}")')
+                    break
+            if opcode == 0:
+                lines.append(f'            a = a >> {value}')
+            elif opcode == 1:
+                lines.append(f'            b = b ^ {operand}')
+            elif opcode == 2:
+                lines.append(f'            b = {value} & 7')
+            elif opcode == 3:
+                if count_instructions:
+                    lines.append(f'            executed += {size}')
+                lines.append(f'            ip = {operand} if a else {ip + 2}')
+                break
+            elif opcode == 4:
+                lines.append('            b = b ^ c')
+            elif opcode == 5:
+                lines.append(f'            append({value} & 7)')
+            elif opcode == 6:
+                lines.append(f'            b = a >> {value}')
+            elif opcode == 7:
+                lines.append(f'            c = a >> {value}')
+            ip += 2
+            if ip in leaders:
+                if count_instructions:
+                    lines.append(f'            executed += {size}')
+                lines.append(f'            ip = {ip}')
+                break
+    if keyword == 'if':
+        # Empty program
+        lines.append('        break')
+    else:
+        lines.append('        else:')
+        lines.append('            break')
+    if count_instructions:
+        lines.append('    return out, executed')
+    else:
+        lines.append('    return out')
+
+    source = '\n'.join(lines) + '\n'
+    namespace = {}
+    exec(compile(source, f'<program {",".join(map(str, program))}>', 'exec'), namespace)
+    run = namespace['run']
+    run.source = source
+    return run
+
+
+def random_program(rng, body_length):
+    """A random program whose loop shifts A down by 3 before jumping back,
+    so it always halts.
+    """
+    program = []
+    for _ in range(body_length):
+        opcode = rng.choice((1, 2, 4, 5, 6, 7))
+        if opcode in (6, 7):
+            # Shifting by a register would make Computer compute pow(2, huge).
+            program.extend((opcode, rng.randrange(4)))
+        else:
+            program.extend((opcode, rng.randrange(7)))
+    program.extend((0, 3, 5, rng.randrange(7), 3, 0))
+    return tuple(program)
+
+
+def test_compile_program():
+    for registers, program in (
+        ([0, 0, 9], (2, 6)),
+        ([10, 0, 0], (5,0,5,1,5,4)),
+        ([2024, 0, 0], (0,1,5,4,3,0)),
+        ([729, 0, 0], (0,1,5,4,3,0)),
+    ):
+        computer = Computer(registers, program)
+        computer.run()
+        assert compile_program(program)(*registers) == computer.output
+
+    rng = random.Random(17)
+    for _ in range(200):
+        program = random_program(rng, rng.randrange(1, 6))
+        run = compile_program(program)
+        for _ in range(5):
+            registers = [rng.randrange(1 << 40), rng.randrange(8), rng.randrange(8)]
+            computer = Computer(registers, program)
+            computer.run()
+            assert run(*registers) == computer.output
+
+
+def test_count_instructions():
+    run = compile_program((5,0,5,1,5,4), count_instructions=True)
+    assert run(10) == ([0, 1, 2], 3)
+    run = compile_program((0,1,5,4,3,0), count_instructions=True)
+    # Three instructions per pass, one pass per bit of 2024.
+    assert run(2024) == ([4,2,5,6,7,7,7,7,3,1,0], 33)
+    assert benchmark((0,1,5,4,3,0), range(1, 100)) > 0
+
+
+def benchmark(program, register_as, b=0, c=0):
+    """Return instructions per second of the compiled engine over the
+    given initial values of register A.
+    """
+    counted = compile_program(program, count_instructions=True)
+    executed = sum(counted(a, b, c)[1] for a in register_as)
+    run = compile_program(program)
+    start = time.perf_counter()
+    for a in register_as:
+        run(a, b, c)
+    elapsed = time.perf_counter() - start
+    return executed / elapsed if elapsed else math.inf
+
+
+def sweep(program, register_as, b=0, c=0):
+    """Run program once for every initial value of A.
+
+    The program is compiled once and the compiled run is called per
+    value.  Returns (outputs, lengths, width): outputs is a flat
+    array('B') holding one row of width values per value of A, padded
+    with zeros, and lengths holds the number of values each run output.
+    """
+    n = len(register_as)
+    run = compile_program(program)
+    emitted = [run(a, b, c) for a in register_as]
+    lengths = array.array('I', (len(e) for e in emitted))
+    width = max(lengths, default=0)
+    outputs = array.array('B', bytes(n * width))
+    for i, e in enumerate(emitted):
+        outputs[i*width:i*width+len(e)] = array.array('B', e)
+    return outputs, lengths, width
+
+
+def test_sweep():
+    rng = random.Random(39)
+    programs = [(0,1,5,4,3,0), (0,3,5,4,3,0), (5,0,5,1,5,4), (2,6)]
+    programs.extend(random_program(rng, rng.randrange(1, 6)) for _ in range(20))
+    for program in programs:
+        register_as = [rng.randrange(1 << 30) for _ in range(50)] + [0]
+        outputs, lengths, width = sweep(program, register_as, 0, 9)
+        for i, a in enumerate(register_as):
+            computer = Computer([a, 0, 9], program)
+            computer.run()
+            assert list(outputs[i*width:i*width+lengths[i]]) == computer.output
+
+
 def solve1(registers, program):
     computer = Computer(registers, program)
     computer.run()
@@ -255,27 +449,121 @@ def test_disassembled():
     assert output == tuple(computer.output)
 
 
-def solve2(registers, program):
-    """Assemble quine by working backwards
+def loop_body(program):
+    """Return the program without its closing jnz 0, checking that each
+    pass through the loop shifts A by 3 bits, outputs one value and sets
+    B and C before reading them.
     """
-    soln = 0
-    # Use a BFS because at some points, there is more than
-    # one possible value that produces a given output.
-    queue = collections.deque()
-    queue.append((0, 0, []))
-    while queue:
-        p, i, op = queue.popleft()
-        if len(op) == len(program):
-            return p
-        # Since A // 8 = p, we can compute the
-        # possible values of A.
-        lower_limit = p*8
-        upper_limit = (p+1)*8
-        for x in range(lower_limit, upper_limit+1):
-            output = disassembled(x)
-            t = len(output)
-            if output == program[-t:]:
-                queue.append((x, i+1, output))
+    if len(program) < 2 or program[-2:] != (3, 0):
+        raise ValueError('Program must end with jnz 0')
+    body = program[:-2]
+    instructions = list(zip(body[::2], body[1::2]))
+    if instructions.count((0, 3)) != 1:
+        raise ValueError('Program must shift A by 3 exactly once per loop')
+    if sum(1 for opcode, _ in instructions if opcode == 5) != 1:
+        raise ValueError('Program must output exactly once per loop')
+    if any(opcode == 3 for opcode, _ in instructions):
+        raise ValueError('Program must not jump inside the loop')
+    # Each pass is searched on its own, so B and C must not carry over
+    # from the pass before.
+    written = set()
+    for opcode, operand in instructions:
+        reads = set()
+        if opcode in (0, 2, 5, 6, 7) and operand in (5, 6):
+            reads.add('bc'[operand - 5])
+        if opcode == 1:
+            reads.add('b')
+        elif opcode == 4:
+            reads.update('bc')
+        unset = reads - written
+        if unset:
+            raise ValueError(f'Program reads {unset.pop().upper()} before writing it in the loop')
+        if opcode in (1, 2, 4, 6):
+            written.add('b')
+        elif opcode == 7:
+            written.add('c')
+    return body
+
+
+@functools.cache
+def compiled_body(body):
+    return compile_program(body)
+
+
+def iteration_outputs(body, candidates, b=0, c=0):
+    """Output of a single pass through the loop for each candidate A."""
+    run = compiled_body(body)
+    return [run(a, b, c)[0] for a in candidates]
+
+
+def find_quine(program, registers=(0, 0, 0), workers=1, batch_size=4096):
+    """Find the smallest A for which program outputs itself.
+
+    Works for any program that loops on A three bits at a time and
+    derives B and C from A afresh on every pass (see loop_body).  A is
+    built from its high bits down: the candidates for the last k outputs
+    are extended by one 3-bit chunk and only the single loop pass that
+    produces the new output is run, since the passes after it only see
+    A >> 3, which is already known to produce the rest.  Candidates are
+    checked in batches, across processes when workers > 1, and the
+    winner is confirmed with a full run.
+    """
+    body = loop_body(program)
+    _, b, c = registers
+    frontier = [0]
+    executor = None
+    if workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        for target in reversed(program):
+            candidates = [p * 8 + k for p in frontier for k in range(8) if p * 8 + k]
+            batches = [
+                candidates[i:i+batch_size]
+                for i in range(0, len(candidates), batch_size)
+            ]
+            if executor:
+                results = executor.map(
+                    iteration_outputs, itertools.repeat(body), batches,
+                    itertools.repeat(b), itertools.repeat(c)
+                )
+            else:
+                results = (iteration_outputs(body, batch, b, c) for batch in batches)
+            frontier = [
+                a
+                for batch, outputs in zip(batches, results)
+                for a, output in zip(batch, outputs)
+                if output == target
+            ]
+    finally:
+        if executor:
+            executor.shutdown()
+
+    run = compile_program(program)
+    for a in sorted(frontier):
+        if tuple(run(a, b, c)) == tuple(program):
+            return a
+    return None
+
+
+def test_find_quine():
+    registers, program = parse_input(os.path.join('data', 'test17b.txt'))
+    assert find_quine(program, registers) == 117440
+    assert find_quine(program, registers, workers=2, batch_size=4) == 117440
+    program = (2, 4, 1, 5, 7, 5, 1, 6, 0, 3, 4, 0, 5, 5, 3, 0)
+    a = find_quine(program)
+    assert a == 105843716614554
+    assert compile_program(program)(a) == list(program)
+    # B carries over from one pass to the next.
+    try:
+        find_quine((5,5,2,4,0,3,3,0), (0,5,0))
+    except ValueError:
+        pass
+    else:
+        assert False, 'Expected ValueError'
+
+
+def solve2(registers, program):
+    return find_quine(program, registers)
 
 
 def main():
@@ -285,7 +573,6 @@ def main():
     soln = solve1(registers, program)
     print('Part 1:', soln)
     assert soln == '7,3,0,5,7,1,4,0,5'
-    registers, program = parse_input(os.path.join('data', 'test17b.txt'))
     soln = solve2(registers, program)
     print('Part 2:', soln)
     assert soln == 202972175280682
@@ -1,10 +1,9 @@
-import collections
+import array
 import dataclasses
-import heapq
 import math
 import os
+import random
 import sys
-from typing import Set, List
 
 import pyperclip
 
@@ -20,31 +19,6 @@ class Vector:
     def __sub__(self, other):
         return Vector(self.r - other.r, self.c - other.c)
 
-    def __lt__(self, other):
-        return self.r < other.r
-
-
-@dataclasses.dataclass(frozen=True)
-class Grid:
-    rows: int
-    columns: int
-    blocks: Set[Vector]
-
-    def inbounds(self, posn: Vector) -> bool:
-        return (
-            posn.r >= 0 and posn.r <= self.rows and
-            posn.c >= 0 and posn.c <= self.columns
-        )
-
-    def corrupted(self, posn: Vector) -> bool:
-        return posn in self.blocks
-
-    def neighbors(self, posn: Vector) -> List[Vector]:
-        for dp in (Vector(0, 1), Vector(0, -1), Vector(1, 0), Vector(-1, 0)):
-            posn0 = posn + dp
-            if self.inbounds(posn0) and not self.corrupted(posn0):
-                yield posn0
-
 
 def parse_input(filepath):
     blocks = []
@@ -57,22 +31,51 @@ def parse_input(filepath):
     return blocks
 
 
+def bfs(blocks, grid_rows, grid_columns, blocks_to_use, target=None):
+    """Breadth-first search from (0, 0) over flat arrays.
+
+    Corrupted cells are a bytearray mask, distances an int32 array with
+    -1 for unreached cells, and the queue a preallocated array that
+    every cell enters at most once.  Returns the distance array; the
+    search stops early once target, a (row, column) pair, is reached.
+    """
+    width = grid_columns + 1
+    n_cells = (grid_rows + 1) * width
+    corrupted = bytearray(n_cells)
+    for block in blocks[:blocks_to_use]:
+        corrupted[block.r * width + block.c] = 1
+    target_cell = -1 if target is None else target[0] * width + target[1]
+    distance = array.array('i', [-1]) * n_cells
+    queue = array.array('i', bytes(4 * n_cells))
+    head, tail = 0, 1
+    distance[0] = 0
+    while head < tail:
+        cell = queue[head]
+        head += 1
+        if cell == target_cell:
+            break
+        d = distance[cell] + 1
+        c = cell % width
+        for cell0, ok in (
+            (cell - width, cell >= width),
+            (cell + width, cell + width < n_cells),
+            (cell - 1, c > 0),
+            (cell + 1, c < grid_columns),
+        ):
+            if ok and not corrupted[cell0] and distance[cell0] < 0:
+                distance[cell0] = d
+                queue[tail] = cell0
+                tail += 1
+    return distance
+
+
 def solve1(blocks, grid_rows, grid_columns, blocks_to_use):
-    blocks0 = set(blocks[:blocks_to_use])
-    grid = Grid(grid_rows, grid_columns, blocks0)
-    origin = Vector(0, 0)
-    queue = []
-    heapq.heappush(queue, (0, origin))
-    distance = collections.defaultdict(lambda: math.inf)
-    distance[origin] = 0
-    while queue:
-        d, p = heapq.heappop(queue)
-        if distance[p] == d:
-            for p0 in grid.neighbors(p):
-                if d + 1 < distance[p0]:
-                    distance[p0] = d + 1
-                    heapq.heappush(queue, (d + 1, p0))
-    return distance[Vector(grid_rows, grid_columns)]
+    distance = bfs(
+        blocks, grid_rows, grid_columns, blocks_to_use,
+        (grid_rows, grid_columns)
+    )
+    d = distance[-1]
+    return math.inf if d < 0 else d
 
 
 def test_solve1():
@@ -80,20 +83,230 @@ def test_solve1():
     assert solve1(blocks, 6, 6, 12) == 22
 
 
+def test_bfs():
+    distance = bfs([Vector(1, 1)], 2, 3, 1)
+    assert list(distance) == [
+        0, 1, 2, 3,
+        1, -1, 3, 4,
+        2, 3, 4, 5,
+    ]
+
+
+def corruption_times(blocks, grid_rows, grid_columns):
+    """Time at which each cell is corrupted, with byte i landing at time
+    i, as an int32 array; cells that are never hit get len(blocks).
+    """
+    width = grid_columns + 1
+    landed = array.array('i', [len(blocks)]) * ((grid_rows + 1) * width)
+    for i in range(len(blocks) - 1, -1, -1):
+        landed[blocks[i].r * width + blocks[i].c] = i
+    return landed
+
+
+def earliest_arrival(blocks, grid_rows, grid_columns, start_time=0):
+    """Earliest time the exit can be reached when byte i lands at time i
+    while walking, one step per time unit, starting from (0, 0) at
+    start_time.  A cell can only be entered before it is corrupted.
+
+    Cells only ever become corrupted, never clear, so arriving earlier
+    is always at least as good and waiting never helps.  That collapses
+    the time-expanded search to a BFS over cells where a cell reached at
+    time t is usable only if t is before its corruption time.
+    """
+    width = grid_columns + 1
+    n_cells = (grid_rows + 1) * width
+    landed = corruption_times(blocks, grid_rows, grid_columns)
+    if start_time >= landed[0]:
+        return math.inf
+    arrival = array.array('i', [-1]) * n_cells
+    queue = array.array('i', bytes(4 * n_cells))
+    head, tail = 0, 1
+    arrival[0] = start_time
+    while head < tail:
+        cell = queue[head]
+        head += 1
+        if cell == n_cells - 1:
+            return arrival[cell]
+        t = arrival[cell] + 1
+        c = cell % width
+        for cell0, ok in (
+            (cell - width, cell >= width),
+            (cell + width, cell + width < n_cells),
+            (cell - 1, c > 0),
+            (cell + 1, c < grid_columns),
+        ):
+            if ok and t < landed[cell0] and arrival[cell0] < 0:
+                arrival[cell0] = t
+                queue[tail] = cell0
+                tail += 1
+    return math.inf
+
+
+def test_earliest_arrival():
+    # Nothing falls in time to matter.
+    blocks = parse_input(os.path.join('data', 'test18a.txt'))
+    assert earliest_arrival(blocks, 6, 6, 0) == 12
+
+    # Compare with an explicit search over (cell, time) states that
+    # also allows waiting in place.
+    rng = random.Random(42)
+    for _ in range(30):
+        blocks = [Vector(rng.randrange(6), rng.randrange(6)) for _ in range(30)]
+        landed = corruption_times(blocks, 5, 5)
+        frontier = {(0, 0)} if landed[0] > 0 else set()
+        expected = math.inf
+        for t in range(60):
+            if (5, 5) in frontier:
+                expected = t
+                break
+            frontier = {
+                (r0, c0)
+                for r, c in frontier
+                for r0, c0 in ((r, c), (r + 1, c), (r - 1, c), (r, c + 1), (r, c - 1))
+                if 0 <= r0 <= 5 and 0 <= c0 <= 5 and t + 1 < landed[r0 * 6 + c0]
+            }
+        assert earliest_arrival(blocks, 5, 5) == expected
+
+
+class DisjointSet:
+    def __init__(self, size):
+        self.parent = array.array('i', range(size))
+        self.size = array.array('i', [1]) * size
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return
+        if self.size[x] < self.size[y]:
+            x, y = y, x
+        self.parent[y] = x
+        self.size[x] += self.size[y]
+
+    def connected(self, x, y):
+        return self.find(x) == self.find(y)
+
+
+def first_blocking_byte(blocks, grid_rows, grid_columns):
+    """Return the first block that cuts (0, 0) off from the far corner,
+    or None.
+
+    Works backwards: start with every block in place, then take blocks
+    away newest first, merging each freed cell with its free neighbors,
+    until the corners join up.  The block whose removal joined them is
+    the answer.
+    """
+    width = grid_columns + 1
+    n_cells = (grid_rows + 1) * width
+    # Index of the first block to land on each cell.
+    landed = array.array('q', [len(blocks)]) * n_cells
+    for i, block in enumerate(blocks):
+        cell = block.r * width + block.c
+        landed[cell] = min(landed[cell], i)
+    free = bytearray(n_cells)
+    cells = DisjointSet(n_cells)
+
+    def release(cell):
+        free[cell] = 1
+        r, c = divmod(cell, width)
+        if r > 0 and free[cell - width]:
+            cells.union(cell, cell - width)
+        if r < grid_rows and free[cell + width]:
+            cells.union(cell, cell + width)
+        if c > 0 and free[cell - 1]:
+            cells.union(cell, cell - 1)
+        if c < grid_columns and free[cell + 1]:
+            cells.union(cell, cell + 1)
+
+    def corners_connected():
+        return free[0] and free[n_cells - 1] and cells.connected(0, n_cells - 1)
+
+    for cell in range(n_cells):
+        if landed[cell] == len(blocks):
+            release(cell)
+    if corners_connected():
+        return None
+    for i in range(len(blocks) - 1, -1, -1):
+        cell = blocks[i].r * width + blocks[i].c
+        if landed[cell] == i:
+            release(cell)
+            if corners_connected():
+                return blocks[i]
+    return None
+
+
+class FallingBytes:
+    """Reports online when falling bytes first cut (0, 0) off from the
+    far corner.
+
+    Corrupted cells are joined in a union-find with their 8 neighbors.
+    The corners are cut off exactly when some group of corrupted cells
+    touches both the top or right edge and the bottom or left edge.
+    """
+
+    def __init__(self, grid_rows, grid_columns):
+        self.rows = grid_rows
+        self.columns = grid_columns
+        self.width = grid_columns + 1
+        n_cells = (grid_rows + 1) * self.width
+        # Two extra nodes for the two halves of the border.
+        self.top_right = n_cells
+        self.bottom_left = n_cells + 1
+        self.corrupted = bytearray(n_cells)
+        self.cells = DisjointSet(n_cells + 2)
+        self.disconnected = False
+
+    def add(self, block):
+        """Drop a byte; returns whether the corners are now cut off."""
+        r, c = block.r, block.c
+        cell = r * self.width + c
+        if not self.corrupted[cell]:
+            self.corrupted[cell] = 1
+            if r == 0 or c == self.columns:
+                self.cells.union(cell, self.top_right)
+            if c == 0 or r == self.rows:
+                self.cells.union(cell, self.bottom_left)
+            for dr in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    r0, c0 = r + dr, c + dc
+                    if 0 <= r0 <= self.rows and 0 <= c0 <= self.columns:
+                        cell0 = r0 * self.width + c0
+                        if self.corrupted[cell0]:
+                            self.cells.union(cell, cell0)
+            if self.cells.connected(self.top_right, self.bottom_left):
+                self.disconnected = True
+        return self.disconnected
+
+
+def test_first_blocking_byte():
+    blocks = parse_input(os.path.join('data', 'test18a.txt'))
+    assert first_blocking_byte(blocks, 6, 6) == Vector(6, 1)
+    falling = FallingBytes(6, 6)
+    assert next(b for b in blocks if falling.add(b)) == Vector(6, 1)
+
+    rng = random.Random(18)
+    for _ in range(30):
+        blocks = [Vector(rng.randrange(8), rng.randrange(8)) for _ in range(40)]
+        # solve1 does not check whether the origin itself is corrupted.
+        blocks = [b for b in blocks if b not in (Vector(0, 0), Vector(7, 7))]
+        expected = None
+        for i in range(1, len(blocks) + 1):
+            if solve1(blocks, 7, 7, i) == math.inf:
+                expected = blocks[i - 1]
+                break
+        assert first_blocking_byte(blocks, 7, 7) == expected
+        falling = FallingBytes(7, 7)
+        assert next((b for b in blocks if falling.add(b)), None) == expected
+
+
 def solve2(blocks, grid_rows, grid_columns):
-    # Binary search the answer
-    lo = 0
-    hi = len(blocks)
-    soln = len(blocks)
-    while lo <= hi:
-        blocks_to_use = lo + ((hi - lo) // 2)
-        shortest_path = solve1(blocks, grid_rows, grid_columns, blocks_to_use)
-        if shortest_path == math.inf:
-            soln = min(soln, blocks_to_use)
-            hi = blocks_to_use - 1
-        else:
-            lo = blocks_to_use + 1
-    return blocks[soln-1]
+    return first_blocking_byte(blocks, grid_rows, grid_columns)
 
 
 def test_solve2():
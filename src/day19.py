@@ -1,5 +1,5 @@
 import collections
-import functools
+import concurrent.futures
 import os
 import sys
 
@@ -15,20 +15,7 @@ def parse_input(filepath):
 
 
 def can_make_design(towel_patterns, design):
-
-    @functools.cache
-    def rec(i):
-        if i == len(design):
-            return True
-
-        result = False
-        for p in towel_patterns:
-            t = len(p)
-            if design[i:i+t] == p:
-                result = result or rec(i+t)
-        return result
-
-    return rec(0)
+    return ways_to_make_design(towel_patterns, design) > 0
 
 
 def test_can_make_design():
@@ -40,10 +27,104 @@ def test_can_make_design():
         assert expected == result
 
 
+class TowelTrie:
+    """Towel patterns in a trie, built once per pattern set.
+
+    Counting the ways to make a design is a left-to-right pass over a
+    count array: from each reachable position, only the trie branches
+    that match the design are followed, without slicing the design.
+    """
+
+    def __init__(self, towel_patterns):
+        # children[node] maps a color to the next node
+        self.children = [{}]
+        self.terminal = [False]
+        for pattern in towel_patterns:
+            node = 0
+            for color in pattern:
+                next_node = self.children[node].get(color)
+                if next_node is None:
+                    next_node = len(self.children)
+                    self.children[node][color] = next_node
+                    self.children.append({})
+                    self.terminal.append(False)
+                node = next_node
+            self.terminal[node] = True
+
+    def ways(self, design):
+        n = len(design)
+        counts = [0] * (n + 1)
+        counts[0] = 1
+        children, terminal = self.children, self.terminal
+        for i in range(n):
+            count = counts[i]
+            if not count:
+                continue
+            node = 0
+            for j in range(i, n):
+                node = children[node].get(design[j])
+                if node is None:
+                    break
+                if terminal[node]:
+                    counts[j + 1] += count
+        return counts[n]
+
+    def possible(self, design):
+        return self.ways(design) > 0
+
+
+def test_towel_trie():
+    towel_patterns, designs = parse_input(os.path.join('data', 'test19a.txt'))
+    trie = TowelTrie(towel_patterns)
+    for design in designs:
+        assert trie.ways(design) == ways_to_make_design(towel_patterns, design)
+        assert trie.possible(design) == can_make_design(towel_patterns, design)
+
+
+# Each worker process keeps its own copy of the trie, sent once when
+# the worker starts rather than with every batch of designs.
+WORKER_TRIE = None
+
+
+def init_worker(trie):
+    global WORKER_TRIE
+    WORKER_TRIE = trie
+
+
+def ways_for_batch(designs):
+    return [WORKER_TRIE.ways(design) for design in designs]
+
+
+def ways_to_make_designs(towel_patterns, designs, workers=None, batch_size=1000):
+    """Number of ways to make each design, fanned out across processes.
+
+    The trie is built once here and shared with each worker when it
+    starts.  With workers=1 everything runs in this process.
+    """
+    trie = TowelTrie(towel_patterns)
+    if workers == 1:
+        return [trie.ways(design) for design in designs]
+    batches = [designs[i:i+batch_size] for i in range(0, len(designs), batch_size)]
+    with concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=init_worker, initargs=(trie,)
+    ) as executor:
+        return [ways for batch in executor.map(ways_for_batch, batches) for ways in batch]
+
+
+def test_ways_to_make_designs():
+    towel_patterns, designs = parse_input(os.path.join('data', 'test19a.txt'))
+    expected = [2, 1, 4, 6, 0, 1, 2, 0]
+    assert ways_to_make_designs(towel_patterns, designs, workers=1) == expected
+    assert ways_to_make_designs(towel_patterns, designs, workers=2, batch_size=3) == expected
+    # Far deeper than the recursion limit.
+    assert ways_to_make_design(('r',), 'r' * 5000) == 1
+
+
 def solve1(towel_patterns, designs):
+    trie = TowelTrie(towel_patterns)
     soln = 0
     for design in designs:
-        if can_make_design(towel_patterns, design):
+        if trie.possible(design):
             soln += 1
     return soln
 
@@ -54,20 +135,16 @@ def test_solve1():
 
 
 def ways_to_make_design(towel_patterns, design):
-
-    @functools.cache
-    def rec(i):
-        if i == len(design):
-            return 1
-
-        result = 0
-        for p in towel_patterns:
-            t = len(p)
-            if design[i:i+t] == p:
-                result += rec(i+t)
-        return result
-
-    return rec(0)
+    # counts[i] is the number of ways to make design[i:], filled in from
+    # the end so there is no recursion however long the design is.
+    n = len(design)
+    counts = [0] * (n + 1)
+    counts[n] = 1
+    for i in range(n - 1, -1, -1):
+        counts[i] = sum(
+            counts[i + len(p)] for p in towel_patterns if design.startswith(p, i)
+        )
+    return counts[0]
 
 
 def test_ways_to_make_design():
@@ -80,9 +157,10 @@ def test_ways_to_make_design():
 
 
 def solve2(towel_patterns, designs):
+    trie = TowelTrie(towel_patterns)
     soln = 0
     for design in designs:
-        soln += ways_to_make_design(towel_patterns, design)
+        soln += trie.ways(design)
     return soln
 
 
@@ -1,6 +1,8 @@
+import array
+import bisect
 import collections
 import dataclasses
-import math
+import itertools
 import os
 import sys
 
@@ -15,14 +17,6 @@ class Vector:
     def __add__(self, other):
         return Vector(self.row + other.row, self.col + other.col)
 
-    def manhattan_distance(self, other):
-        return abs(self.row - other.row) + abs(self.col - other.col)
-
-    def __lt__(self, other):
-        if self.row == other.row:
-            return self.col < other.col
-        return self.row < other.row
-
 
 def parse_input(filepath):
     grid = []
@@ -47,19 +41,6 @@ def neighbors(grid, posn):
             yield posn0
 
 
-def cheat_neighbors(grid, init_posn, cheat_duration):
-    curr_posns = set([init_posn])
-    next_posns = set()
-    for _ in range(cheat_duration):
-        for posn in curr_posns:
-            next_posns.add(posn)
-            for offset in (Vector(0, 1), Vector(0, -1), Vector(1, 0), Vector(-1, 0)):
-                posn0 = posn + offset
-                next_posns.add(posn0)
-        curr_posns, next_posns = next_posns, set()
-    return curr_posns
-
-
 def is_wall(grid, posn):
     return grid[posn.row][posn.col] == '#'
 
@@ -78,68 +59,240 @@ def find_source_and_sink(grid):
     return source, sink
 
 
-def bfs(grid, origin):
-    distance = collections.defaultdict(lambda: math.inf)
-    queue = collections.deque()
-    distance[origin] = 0
-    queue.append(origin)
-    while queue:
-        posn = queue.popleft()
-        for posn0 in neighbors(grid, posn):
-            if not is_wall(grid, posn0) and distance[posn] + 1 < distance[posn0]:
-                distance[posn0] = distance[posn] + 1
-                queue.append(posn0)
-    return distance
-
-
-def compute_cheat_distances(grid, distance_from_source, distance_to_sink, shortest_path, cheat_duration):
-    cheat_distances = []
-    all_cheat_offsets = list(cheat_neighbors(grid, Vector(0, 0), cheat_duration))
-    all_cheat_offsets.sort()
-    # For each cell, see how much is saved if we cheat
+def track_order(grid):
+    """Return the rows and columns of the track cells in order from S
+    to E as two int arrays.  The track must be a single path.
+    """
+    source, sink = find_source_and_sink(grid)
+    rows = array.array('i', [source.row])
+    cols = array.array('i', [source.col])
+    prev, posn = None, source
+    while posn != sink:
+        onward = [
+            posn0 for posn0 in neighbors(grid, posn)
+            if posn0 != prev and not is_wall(grid, posn0)
+        ]
+        if len(onward) != 1:
+            raise ValueError(f'Track branches or ends at {posn}')
+        prev, posn = posn, onward[0]
+        rows.append(posn.row)
+        cols.append(posn.col)
+    return rows, cols
+
+
+def count_cheats(rows, cols, cheat_duration, saves_at_least):
+    """Count cheats saving at least saves_at_least along a single track.
+
+    A cheat from track index i to j saves (j - i) minus the Manhattan
+    distance between them.  Consecutive track cells are one step apart,
+    so when cell j is d > cheat_duration away, no cell before
+    j + (d - cheat_duration) can be in range and those are skipped.
+    """
+    n = len(rows)
+    total = 0
+    for i in range(n):
+        ri, ci = rows[i], cols[i]
+        j = i + saves_at_least + 1
+        while j < n:
+            d = abs(rows[j] - ri) + abs(cols[j] - ci)
+            if d > cheat_duration:
+                j += d - cheat_duration
+                continue
+            if j - i - d >= saves_at_least:
+                total += 1
+            j += 1
+    return total
+
+
+def test_count_cheats():
+    grid = parse_input(os.path.join('data', 'test20a.txt'))
+    rows, cols = track_order(grid)
+    assert len(rows) == 85
+    assert count_cheats(rows, cols, 2, 1) == 44
+    assert count_cheats(rows, cols, 2, 64) == 1
+    assert count_cheats(rows, cols, 20, 50) == 285
+    assert count_cheats(rows, cols, 20, 76) == 3
+
+
+def diamond_offsets(radius, width):
+    """Flat-index deltas, and their Manhattan lengths, of every cell from
+    1 to radius steps away in a grid of the given row width.
+    """
+    deltas = array.array('i')
+    lengths = array.array('i')
+    for dr in range(-radius, radius + 1):
+        span = radius - abs(dr)
+        for dc in range(-span, span + 1):
+            if dr or dc:
+                deltas.append(dr * width + dc)
+                lengths.append(abs(dr) + abs(dc))
+    return deltas, lengths
+
+
+def distance_fields(grid, pad):
+    """BFS distances from S and to E over the grid padded by pad wall
+    cells on every side, as flat int32 arrays with -1 for walls and
+    unreachable cells.  Returns (from_source, to_sink, width, shortest).
+    """
+    width = len(grid[0]) + 2 * pad
+    n_cells = (len(grid) + 2 * pad) * width
+    open_cells = bytearray(n_cells)
+    source, sink = find_source_and_sink(grid)
     for r, row in enumerate(grid):
-        for c, _ in enumerate(row):
-            posn = Vector(r, c)
-            if not is_wall(grid, posn):
-                # Get cheat neighbors
-                for offset in all_cheat_offsets:
-                    posn0 = posn + offset
-                    if inbounds(grid, posn0) and not is_wall(grid, posn0):
-                        d = (
-                            distance_from_source[posn] +
-                            posn.manhattan_distance(posn0) +
-                            distance_to_sink[posn0]
-                        )
-                        if d < shortest_path:
-                            cheat_distances.append(d)
-    return cheat_distances
+        for c, val in enumerate(row):
+            open_cells[(r + pad) * width + c + pad] = val != '#'
+
+    def bfs(origin):
+        distance = array.array('i', [-1]) * n_cells
+        queue = collections.deque([origin])
+        distance[origin] = 0
+        while queue:
+            cell = queue.popleft()
+            for cell0 in (cell + 1, cell - 1, cell + width, cell - width):
+                if open_cells[cell0] and distance[cell0] < 0:
+                    distance[cell0] = distance[cell] + 1
+                    queue.append(cell0)
+        return distance
+
+    # Padding is at least one cell so neighbours never leave the array.
+    assert pad >= 1
+    from_source = bfs((source.row + pad) * width + source.col + pad)
+    to_sink = bfs((sink.row + pad) * width + sink.col + pad)
+    shortest = from_source[(sink.row + pad) * width + sink.col + pad]
+    return from_source, to_sink, width, shortest
+
+
+class RaceTrack:
+    """Distance fields for one track, computed once, answering savings
+    queries for any duration up to max_duration.
+
+    The first query makes a single pass over every cheat of length up
+    to max_duration and builds cumulative savings histograms.  After
+    that, each threshold query is a binary search.
+    """
+
+    def __init__(self, grid, max_duration=20):
+        self.max_duration = max_duration
+        self.from_source, self.to_sink, self.width, self.shortest = distance_fields(
+            grid, max(max_duration, 1)
+        )
+        self.histograms = None
+        # Per duration: sorted savings and the number of cheats saving
+        # at least each of them.
+        self.savings = None
+        self.at_least = None
+
+    def build(self):
+        if self.histograms is not None:
+            return
+        from_source, to_sink, shortest = self.from_source, self.to_sink, self.shortest
+        offsets = tuple(zip(*diamond_offsets(self.max_duration, self.width)))
+        # by_length[length][saving] for cheats of exactly that length
+        by_length = [
+            array.array('q', bytes(8 * (shortest + 1)))
+            for _ in range(self.max_duration + 1)
+        ]
+        for cell, before in enumerate(from_source):
+            if before < 0:
+                continue
+            for delta, length in offsets:
+                after = to_sink[cell + delta]
+                if after >= 0:
+                    saving = shortest - (before + length + after)
+                    if saving > 0:
+                        by_length[length][saving] += 1
+        self.histograms = [array.array('q', bytes(8 * (shortest + 1)))]
+        self.savings = [[]]
+        self.at_least = [[]]
+        for length in range(1, self.max_duration + 1):
+            histogram = array.array('q', self.histograms[-1])
+            for saving, count in enumerate(by_length[length]):
+                histogram[saving] += count
+            self.histograms.append(histogram)
+            savings = [saving for saving, count in enumerate(histogram) if count]
+            at_least = list(itertools.accumulate(histogram[saving] for saving in reversed(savings)))
+            self.savings.append(savings)
+            self.at_least.append(at_least[::-1])
+
+    def check_duration(self, duration):
+        if not 0 <= duration <= self.max_duration:
+            raise ValueError(f'Duration {duration} is outside 0..{self.max_duration}')
+
+    def histogram(self, duration):
+        """Map of saving to number of cheats of at most duration with it."""
+        self.check_duration(duration)
+        self.build()
+        return {s: self.histograms[duration][s] for s in self.savings[duration]}
+
+    def histograms_for(self, durations):
+        return {duration: self.histogram(duration) for duration in durations}
+
+    def count(self, duration, saves_at_least):
+        """Number of cheats of at most duration saving saves_at_least or more."""
+        self.check_duration(duration)
+        self.build()
+        savings = self.savings[duration]
+        i = bisect.bisect_left(savings, saves_at_least)
+        return self.at_least[duration][i] if i < len(savings) else 0
+
+
+def savings_histograms(grid, max_duration):
+    """Histogram of savings for every cheat duration from 1 to
+    max_duration in one pass.
+
+    Returns a list where histograms[duration][saving] is the number of
+    cheats of at most that duration that save exactly saving.
+    """
+    track = RaceTrack(grid, max_duration)
+    track.build()
+    return track.histograms
+
+
+def test_savings_histograms():
+    grid = parse_input(os.path.join('data', 'test20a.txt'))
+    histograms = savings_histograms(grid, 20)
+    rows, cols = track_order(grid)
+    for duration in (2, 5, 20):
+        for saves_at_least in (1, 50, 70):
+            assert (
+                sum(histograms[duration][saves_at_least:]) ==
+                count_cheats(rows, cols, duration, saves_at_least)
+            )
 
 
 def solve1(grid, saves_at_least=100, cheat_duration=2):
-    source, sink = find_source_and_sink(grid)
-    # BFS to compute the distance between each cell and the sink
-    distance_from_source = bfs(grid, source)
-    # BFS to compute the distance between each cell and the sink
-    distance_to_sink = bfs(grid, sink)
-    assert distance_from_source[sink] == distance_to_sink[source]
-    shortest_path = distance_to_sink[source]
-    # For each cell, compute the distance if you cheated from here
-    cheat_distances = compute_cheat_distances(
-        grid, distance_from_source, distance_to_sink,
-        shortest_path, cheat_duration
-    )
-    # Count the number of cheats that save 100+
-    save_freqs = collections.Counter(shortest_path - d for d in cheat_distances)
-    return sum(v for k, v in save_freqs.items() if k >= saves_at_least)
+    rows, cols = track_order(grid)
+    return count_cheats(rows, cols, cheat_duration, max(saves_at_least, 1))
+
+
+def test_solve1():
+    grid = parse_input(os.path.join('data', 'test20a.txt'))
+    assert solve1(grid, 64, 2) == 1
+    assert solve1(grid, 50, 20) == 285
+
+
+def test_race_track():
+    grid = parse_input(os.path.join('data', 'test20a.txt'))
+    track = RaceTrack(grid, 20)
+    assert track.histogram(2) == {
+        2: 14, 4: 14, 6: 2, 8: 4, 10: 2, 12: 3,
+        20: 1, 36: 1, 38: 1, 40: 1, 64: 1
+    }
+    assert track.count(2, 64) == 1
+    assert track.count(2, 65) == 0
+    assert track.count(2, 1) == 44
+    assert track.count(20, 50) == 285
+    assert track.count(20, 76) == 3
+    assert track.count(20, 77) == 0
 
 
 def main():
     "Main program"
     grid = parse_input(os.path.join('data', 'input20.txt'))
-    soln = solve1(grid, saves_at_least=100, cheat_duration=2)
+    soln = solve1(grid, 100, 2)
     print('Part 1:', soln)
     assert soln == 1378
-    soln = solve1(grid, saves_at_least=100, cheat_duration=20)
+    soln = solve1(grid, 100, 20)
     print('Part 2:', soln)
     assert soln == 975379
     pyperclip.copy(soln)
@@ -1,9 +1,12 @@
 import collections
 import dataclasses
 import functools
+import hashlib
+import json
 import math
 import os
 import sys
+import tempfile
 
 import pyperclip
 
@@ -17,66 +20,139 @@ class Vector:
         return Vector(self.row + other.row, self.col + other.col)
 
 
-NUMBER_PAD = tuple('789\n456\n123\n.0A'.split('\n'))
-DIRECTION_PAD = tuple('.^A\n<v>'.split('\n'))
+NUMBER_PAD = '789\n456\n123\n.0A'
+DIRECTION_PAD = '.^A\n<v>'
 OFFSETS = {
     '^': Vector(-1, 0),
     'v': Vector(1, 0),
     '<': Vector(0, -1),
     '>': Vector(0, 1)
 }
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'aoc2024-day21')
+# Bump when compute_paths changes so stale cached tables are ignored.
+CACHE_FORMAT = 'full-search-v1'
+
+
+class Keypad:
+    """A keypad loaded from a layout of rows of single-character keys,
+    with '.' for gaps the arm must not cross.  The arm starts on A.
+
+    The table of all shortest moves between keys is found by a full
+    search over the layout the first time it is needed, then kept in
+    memory and, when cache_dir is set, on disk.
+    """
+
+    def __init__(self, layout, cache_dir=CACHE_DIR):
+        self.layout = layout
+        self.rows = tuple(layout.split('\n'))
+        self.locations = dict()
+        for r, row in enumerate(self.rows):
+            for c, val in enumerate(row):
+                if val != '.':
+                    self.locations[val] = Vector(r, c)
+        self.keys = ''.join(self.locations)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.cache_dir = cache_dir
+        self._paths = None
+
+    def is_key(self, posn):
+        return (
+            0 <= posn.row < len(self.rows) and
+            0 <= posn.col < len(self.rows[posn.row]) and
+            self.rows[posn.row][posn.col] != '.'
+        )
+
+    @property
+    def paths(self):
+        """paths[origin][dest] lists every shortest move sequence from
+        origin to dest, each followed by pressing A.
+        """
+        if self._paths is None:
+            cache_file = self.cache_file()
+            if cache_file:
+                self._paths = self.load_paths(cache_file)
+            if self._paths is None:
+                self._paths = self.compute_paths()
+                if cache_file:
+                    self.save_paths(cache_file)
+        return self._paths
+
+    def cache_file(self):
+        if not self.cache_dir:
+            return None
+        key = f'{CACHE_FORMAT}\n{self.layout}'
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'keypad-{digest}.json')
+
+    def load_paths(self, cache_file):
+        """Cached table, or None if it is missing or unreadable."""
+        try:
+            with open(cache_file, 'r') as infile:
+                paths = json.load(infile)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(paths, dict) or set(paths) != set(self.keys):
+            return None
+        return paths
+
+    def save_paths(self, cache_file):
+        # Write to a temporary file and rename it into place so other
+        # processes never see a partly written table.
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as outfile:
+                json.dump(self._paths, outfile)
+            os.replace(tmp_file, cache_file)
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
+
+    def compute_paths(self):
+        all_paths = dict()
+        for origin_val, origin_posn in self.locations.items():
+            # BFS from origin, keeping every parent on a shortest route
+            distance = {origin_posn: 0}
+            parents = collections.defaultdict(list)
+            queue = collections.deque([origin_posn])
+            while queue:
+                posn = queue.popleft()
+                for move, offset in OFFSETS.items():
+                    posn0 = posn + offset
+                    if not self.is_key(posn0):
+                        continue
+                    if posn0 not in distance:
+                        distance[posn0] = distance[posn] + 1
+                        queue.append(posn0)
+                    if distance[posn0] == distance[posn] + 1:
+                        parents[posn0].append((posn, move))
+
+            # Walk back from each key to list every shortest route
+            @functools.cache
+            def routes(posn):
+                if posn == origin_posn:
+                    return ('',)
+                return tuple(
+                    route + move
+                    for parent, move in parents[posn]
+                    for route in routes(parent)
+                )
+
+            all_paths[origin_val] = {
+                dest_val: [route + 'A' for route in routes(dest_posn)]
+                for dest_val, dest_posn in self.locations.items()
+            }
+        return all_paths
 
 
-def is_dot(grid, curr) -> bool:
-    """Return True if the curr position in grid is the dot"""
-    return grid[curr.row][curr.col] == '.'
-
-
-def is_valid_path(grid, origin, dest, path) -> bool:
-    """Verify that path does not touch the ."""
-    curr = origin
-    if is_dot(grid, curr):
-        return False
-    for d in path:
-        curr = curr + OFFSETS[d]
-        if is_dot(grid, curr):
-            return False
-    return curr == dest
-
-
-# Compute the paths in each grid
-def compute_all_paths(grid):
-    locations = dict()
-    for r, row in enumerate(grid):
-        for c, val in enumerate(row):
-            if val != '.':
-                locations[val] = Vector(r, c)
-
-    all_paths = dict()
-    for origin_val, origin_posn in locations.items():
-        all_paths[origin_val] = dict()
-        for dest_val, dest_posn in locations.items():
-            all_paths[origin_val][dest_val] = list()
-            # Shortest path between origin and dest will have same up/dn and lf/rt
-            # We and do up/dn followed by lf/rt or lf/rt followed by up/dn
-            # It is possible that a path might touch the . space, in which case it should be discarded
-            dr = dest_posn.row - origin_posn.row
-            dc = dest_posn.col - origin_posn.col
-            updn = ('^' if dr < 0 else 'v') * abs(dr)
-            lfrt = ('<' if dc < 0 else '>') * abs(dc)
-            path1 = updn + lfrt
-            if is_valid_path(grid, origin_posn, dest_posn, path1):
-                # Add pressing A
-                all_paths[origin_val][dest_val].append(path1 + 'A')
-            path2 = lfrt + updn
-            if path2 != path1 and is_valid_path(grid, origin_posn, dest_posn, path2):
-                # Add pressing the A
-                all_paths[origin_val][dest_val].append(path2 + 'A')
-    return all_paths
-
-
-NP_PATHS = compute_all_paths(NUMBER_PAD)
-DP_PATHS = compute_all_paths(DIRECTION_PAD)
+@functools.cache
+def number_pad():
+    return Keypad(NUMBER_PAD)
+
+
+@functools.cache
+def direction_pad():
+    return Keypad(DIRECTION_PAD)
 
 
 def parse_input(filepath):
@@ -85,38 +161,68 @@ def parse_input(filepath):
     return data
 
 
-def paths_between(device_name, prev_key, curr_key):
-    """Return list of all the paths between prev_key and curr_key in the given device"""
-    if device_name == 'np':
-        return NP_PATHS[prev_key][curr_key]
-    return DP_PATHS[prev_key][curr_key]
+def compose(keypad, controller_costs):
+    """Min-plus step: cost matrix for pressing keys on keypad when its
+    arm is driven from a directional pad with the given cost matrix.
+
+    Every move on this keypad starts and ends with the controller on A,
+    so a path costs the controller's moves along 'A' + path.
+    """
+    index = direction_pad().index
+    matrix = []
+    for prev_key in keypad.keys:
+        row = []
+        for next_key in keypad.keys:
+            best_cost = math.inf
+            for path in keypad.paths[prev_key][next_key]:
+                path = 'A' + path
+                cost = sum(
+                    controller_costs[index[pk]][index[nk]]
+                    for pk, nk in zip(path[:-1], path[1:])
+                )
+                best_cost = min(best_cost, cost)
+            row.append(best_cost)
+        matrix.append(tuple(row))
+    return tuple(matrix)
+
+
+def directional_cost_matrix(robot_level):
+    """Cost matrix, indexed like direction_pad().keys, for pressing a key
+    on the directional pad robot_level robots away from the human.
+    """
+    # The human presses any key directly.
+    keypad = direction_pad()
+    matrix = tuple((1,) * len(keypad.keys) for _ in keypad.keys)
+    for _ in range(robot_level):
+        matrix = compose(keypad, matrix)
+    return matrix
 
 
-def translate(device_name, code):
-    result = []
-    # (index into code, acc)
-    queue = collections.deque()
-    queue.append((0, ''))
-    while queue:
-        i, acc = queue.popleft()
-        if i >= len(code):
-            result.append(''.join(acc))
-        else:
-            prev_key = 'A' if i == 0 else code[i-1]
-            curr_key = code[i]
-            for path in paths_between(device_name, prev_key, curr_key):
-                queue.append((i+1, acc + path))
-    return result
+@functools.cache
+def cost_matrix(keypad, robot_level):
+    """Cost matrix, indexed like keypad.keys, for pressing a key on
+    keypad with robot_level directional pad robots in between.
+    """
+    return compose(keypad, directional_cost_matrix(robot_level))
+
+
+def numeric_cost_matrix(robot_level):
+    return cost_matrix(number_pad(), robot_level)
+
+
+def get_code_cost(code, robot_level, keypad=None):
+    keypad = keypad or number_pad()
+    matrix = cost_matrix(keypad, robot_level)
+    code = 'A' + code
+    return sum(
+        matrix[keypad.index[pk]][keypad.index[nk]]
+        for pk, nk in zip(code[:-1], code[1:])
+    )
 
 
 def compute_shortest_code(original_code, devices):
-    curr_codes = [original_code]
-    next_codes = []
-    for device in devices:
-        for code in curr_codes:
-            next_codes.extend(translate(device, code))
-        curr_codes, next_codes = next_codes, []
-    return min(len(code) for code in curr_codes)
+    # One numeric pad followed by directional pads
+    return get_code_cost(original_code, len(devices) - 1)
 
 
 def test_shortest_code():
@@ -142,40 +248,48 @@ def test_solve1():
     assert solve1(codes) == 126384
 
 
-@functools.cache
-def get_cost(prev_key, next_key, robot_level, keypad='dp'):
-    keypad_paths = NP_PATHS if keypad == 'np' else DP_PATHS
-    # Base Case: return the length of the shortest path between prev_key and next_key
-    if robot_level == 0:
-        return min(len(path) for path in keypad_paths[prev_key][next_key])
-    # Recursive Case
-    best_cost = math.inf
-    for path in keypad_paths[prev_key][next_key]:
-        # Start with A
-        path = 'A' + path
-        cost = 0
-        for pk, nk in zip(path[:-1], path[1:]):
-            cost += get_cost(pk, nk, robot_level - 1, 'dp')
-        best_cost = min(best_cost, cost)
-    return best_cost
-
-
-def get_code_cost(code, robot_level, keypad):
-    code = 'A' + code
-    cost = 0
-    for pk, nk in zip(code[:-1], code[1:]):
-        cost += get_cost(pk, nk, robot_level, keypad)
-    return cost
-
-
 def solve2(codes, robot_level=2):
     soln = 0
     for code in codes:
-        cost = get_code_cost(code, robot_level, 'np')
+        cost = get_code_cost(code, robot_level)
         soln += (cost * int(code[:-1]))
     return soln
 
 
+def test_solve2():
+    codes = ['029A', '980A', '179A', '456A', '379A']
+    assert solve2(codes, 2) == 126384
+    assert solve2(codes, 25) == 154115708116294
+
+
+def test_keypad():
+    # The full search also finds routes that are not L-shaped
+    keypad = Keypad('ABC\nDEF\nGHI', cache_dir=None)
+    assert sorted(keypad.paths['A']['E']) == ['>vA', 'v>A']
+    assert len(keypad.paths['A']['I']) == 6
+    assert keypad.paths['E']['E'] == ['A']
+    # Gaps are never crossed
+    assert sorted(number_pad().paths['A']['1']) == ['<^<A', '^<<A']
+
+    # The disk cache round-trips
+    with tempfile.TemporaryDirectory() as cache_dir:
+        layout = '\n'.join(('Abcdefgh', 'ijk.mnop', 'qrstuvwx', 'yz012345', '6789.+-*'))
+        first = Keypad(layout, cache_dir)
+        assert len(first.keys) == 38
+        second = Keypad(layout, cache_dir)
+        assert second.paths == first.paths
+        assert os.listdir(cache_dir)
+        assert get_code_cost('b+*', 3, second) == get_code_cost('b+*', 3, first)
+
+        # A damaged cache file is recomputed and replaced
+        with open(first.cache_file(), 'w') as outfile:
+            outfile.write('{"A": {')
+        third = Keypad(layout, cache_dir)
+        assert third.paths == first.paths
+        assert Keypad(layout, cache_dir).load_paths(first.cache_file()) == first.paths
+        assert len(os.listdir(cache_dir)) == 1
+
+
 def main():
     """Main program"""
     codes = parse_input(os.path.join('data', 'input21.txt'))
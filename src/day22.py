@@ -1,5 +1,4 @@
-import collections
-import itertools
+import array
 import os
 import sys
 
@@ -12,17 +11,13 @@ def parse_input(filepath):
     return data
 
 
+MASK = 0xFFFFFF  # Secrets are kept modulo 2**24
+
+
 def evolve(n):
-    MOD = 16777216
-    x = n * 64
-    n = n ^ x
-    n %= MOD
-    x = n // 32
-    n = n ^ x
-    n %= MOD
-    x = n * 2048
-    n = n ^ x
-    n %= MOD
+    n = (n ^ (n << 6)) & MASK
+    n ^= n >> 5
+    n = (n ^ (n << 11)) & MASK
     return n
 
 
@@ -43,8 +38,58 @@ def test_transform():
         assert n == ex
 
 
+def evolve_all(secrets):
+    """Advance every buyer's secret one step, in place in the uint32
+    array secrets, with the steps of evolve inlined in the loop.
+    """
+    mask = MASK
+    for i, n in enumerate(secrets):
+        n ^= (n << 6) & mask
+        n ^= n >> 5
+        secrets[i] = n ^ ((n << 11) & mask)
+
+
+def transform_all(numbers, repeat=2000):
+    secrets = array.array('I', numbers)
+    for _ in range(repeat):
+        evolve_all(secrets)
+    return secrets
+
+
+def test_transform_all():
+    numbers = [1, 10, 100, 2024, 123]
+    assert list(transform_all(numbers, 10)) == [transform(n, 10) for n in numbers]
+
+
+def price_matrix(numbers, steps=2000):
+    """Prices for every buyer as a flat uint8 array of len(numbers) rows
+    by steps + 1 columns, one column filled per step over all buyers.
+    """
+    width = steps + 1
+    prices = array.array('B', bytes(len(numbers) * width))
+    secrets = array.array('I', numbers)
+    for i, n in enumerate(secrets):
+        prices[i * width] = n % 10
+    mask = MASK
+    for step in range(1, width):
+        for i, n in enumerate(secrets):
+            n ^= (n << 6) & mask
+            n ^= n >> 5
+            n ^= (n << 11) & mask
+            secrets[i] = n
+            prices[i * width + step] = n % 10
+    return prices
+
+
+def test_price_matrix():
+    prices = price_matrix([123, 1], 9)
+    assert list(prices[:10]) == [3, 0, 6, 5, 4, 4, 6, 4, 4, 2]
+    assert prices[10] == 1
+    assert prices[-1] == transform(1, 9) % 10
+
+
 def solve1(numbers):
-    return sum(transform(n) for n in numbers)
+    return sum(transform_all(numbers))
 
 
 def test_solve1():
@@ -52,52 +97,31 @@ def test_solve1():
     assert solve1(numbers) == 37327623
 
 
-class Record:
-    def __init__(self, secret):
-        self.secret = secret
-        self.price = secret % 10
-        self.change = None
-        self.window = None
-
-    def __str__(self):
-        return f"{self.secret} {self.price} {self.change} {self.window}"
-
-
-class Monkey:
-    def __init__(self, secret):
-        self.records = []
-        self.records.append(Record(secret))
-        for _ in range(2000):
-            secret = evolve(secret)
-            self.records.append(Record(secret))
-
-        for i, _ in enumerate(self.records[1:], start=1):
-            self.records[i].change = self.records[i].price - self.records[i-1].price
-
-        for i, _ in enumerate(self.records[4:], start=4):
-            self.records[i].window = tuple(x.change for x in self.records[i-3:i+1])
-
-        # Cache
-        self.cache = dict()
-        for record in self.records:
-            if record.window not in self.cache:
-                self.cache[record.window] = record.price
-
-    def bananas_for(self, target_window):
-        return self.cache.get(target_window, 0)
-
-
-def solve2(numbers):
-    monkeys = [Monkey(n) for n in numbers]
-    possible = set()
-    for monkey in monkeys:
-        for record in monkey.records:
-            if record.window:
-                possible.add(record.window)
-    soln = 0
-    for target in possible:
-        soln = max(soln, sum(monkey.bananas_for(target) for monkey in monkeys))
-    return soln
+def solve2(numbers, steps=2000):
+    """Best total of bananas over every window of four price changes.
+
+    Each window is packed into one base-19 integer so the totals live
+    in a flat array, and each buyer only counts the first time it sees
+    a window.
+    """
+    width = steps + 1
+    prices = price_matrix(numbers, steps)
+    n_windows = 19 ** 4
+    totals = array.array('I', bytes(4 * n_windows))
+    seen_by = array.array('i', [-1]) * n_windows
+    for buyer in range(len(numbers)):
+        row = prices[buyer * width:(buyer + 1) * width]
+        window = 0
+        for i in range(1, width):
+            window = (window * 19 + row[i] - row[i - 1] + 9) % n_windows
+            if i >= 4 and seen_by[window] != buyer:
+                seen_by[window] = buyer
+                totals[window] += row[i]
+    return max(totals)
+
+
+def test_solve2():
+    assert solve2([1, 2, 3, 2024]) == 23
 
 
 def main():